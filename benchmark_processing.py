@@ -0,0 +1,353 @@
+"""
+Benchmarks for the journey processing path, run against synthetic TFL payloads.
+
+    python benchmark_processing.py                  # run and print results
+    python benchmark_processing.py --save-baseline  # store results in benchmark_baseline.json
+    python benchmark_processing.py --check          # fail if a stage is slower than the baseline
+
+Throughput is machine dependent; refresh the baseline when moving to new hardware.
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+
+import update_journey_data as ujd
+from tfl_synthetic import generate_journey_results
+from tests.test_platform_extraction import PLATFORM_CORPUS
+
+BASELINE_FILE = "benchmark_baseline.json"
+REGRESSION_TOLERANCE = 0.30  # Allowed throughput drop vs. baseline before --check fails
+
+# Payload shapes to benchmark (arguments for generate_journey_results)
+SCENARIOS = {
+    "small": dict(num_journeys=10, rail_legs=(1, 2), path_points=20),
+    "large": dict(num_journeys=200, rail_legs=(1, 3), path_points=60, delay_rate=0.3),
+}
+BENCH_START = datetime(2025, 10, 16, 7, 0)  # Fixed so payloads are identical between runs
+BENCH_SEED = 1234
+
+
+def _timestamps(payload):
+    stamps = []
+    for journey in payload["journeys"]:
+        stamps += [journey["startDateTime"], journey["arrivalDateTime"]]
+        for leg in journey["legs"]:
+            stamps += [leg["departureTime"], leg["arrivalTime"]]
+    return stamps
+
+
+def _legs(payload):
+    return [leg for journey in payload["journeys"] for leg in journey["legs"]]
+
+
+# --- Reference implementations ---
+# Earlier versions of hot functions, kept so the optimised ones can be compared against them.
+
+def legacy_parse_datetime(dt_string):
+    try:
+        return datetime.fromisoformat(dt_string.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+
+
+def legacy_format_time(dt):
+    if dt:
+        return dt.strftime("%H:%M")
+    return "N/A"
+
+
+def legacy_extract_platform_from_instruction(instruction_text):
+    if not instruction_text:
+        return None
+    text_lower = instruction_text.lower()
+    if 'platform' in text_lower:
+        parts = text_lower.split('platform')
+        if len(parts) > 1:
+            after = parts[1].strip()
+            platform = ''
+            for char in after:
+                if char.isdigit() or (char.isalpha() and len(platform) == 1):
+                    platform += char
+                elif platform:
+                    break
+            if platform:
+                return platform.upper()
+    return None
+
+
+def legacy_classify_legs(legs):
+    """The three passes process_journey used to make over a journey's legs."""
+    rail_legs = [leg for leg in legs if leg.get('mode', {}).get('name', '') in ['national-rail', 'overground']]
+    if not rail_legs:
+        return rail_legs, False, "no_rail_leg"
+    allowed_modes = ['walking', 'walk', 'national-rail', 'overground']
+    if any(leg.get('mode', {}).get('name', '') not in allowed_modes for leg in legs):
+        return rail_legs, False, "non_rail_leg"
+    delayed = any(leg.get('arrivalPoint', {}).get('timing', {}).get('arrivalDelay', 0) > 60 for leg in legs)
+    return rail_legs, delayed, "too_many_rail_legs" if len(rail_legs) > 2 else None
+
+
+# --- Stages ---
+# Each stage takes (payload, raw_bytes) and returns (callable, operations per call).
+
+def stage_parse_datetime(payload, raw):
+    stamps = _timestamps(payload)
+    return (lambda: [ujd.parse_datetime(s) for s in stamps]), len(stamps)
+
+
+def stage_timestamps_legacy(payload, raw):
+    """Parse + format every timestamp with the original, uncached implementation."""
+    stamps = _timestamps(payload)
+    return (lambda: [legacy_format_time(legacy_parse_datetime(s)) for s in stamps]), len(stamps)
+
+
+def stage_timestamps_cold(payload, raw):
+    """Parse + format with the memo cleared first (first cycle after start-up)."""
+    stamps = _timestamps(payload)
+
+    def run():
+        ujd.parse_timestamp.cache_clear()
+        return [ujd.parse_datetime_hh_mm(s) for s in stamps]
+    return run, len(stamps)
+
+
+def stage_timestamps(payload, raw):
+    """Parse + format with a warm memo (timestamps recurring across journeys and cycles)."""
+    stamps = _timestamps(payload)
+    return (lambda: [ujd.parse_datetime_hh_mm(s) for s in stamps]), len(stamps)
+
+
+def stage_platform(payload, raw):
+    legs = _legs(payload)
+
+    def run():
+        for leg in legs:
+            ujd.get_platform_from_leg(leg, is_departure=True)
+            ujd.get_platform_from_leg(leg, is_departure=False)
+    return run, 2 * len(legs)
+
+
+def _instruction_texts(payload):
+    """Payload instruction texts plus the corpus, as the fallback path sees them."""
+    texts = [leg["instruction"]["detailed"] for leg in _legs(payload)]
+    return texts + [text for text, _ in PLATFORM_CORPUS]
+
+
+def stage_platform_text_legacy(payload, raw):
+    texts = _instruction_texts(payload)
+    return (lambda: [legacy_extract_platform_from_instruction(t) for t in texts]), len(texts)
+
+
+def stage_platform_text(payload, raw):
+    texts = _instruction_texts(payload)
+    return (lambda: [ujd.extract_platform_from_instruction(t) for t in texts]), len(texts)
+
+
+def stage_classify_legacy(payload, raw):
+    journeys = [journey["legs"] for journey in payload["journeys"]]
+    return (lambda: [legacy_classify_legs(legs) for legs in journeys]), len(journeys)
+
+
+def stage_classify(payload, raw):
+    journeys = [journey["legs"] for journey in payload["journeys"]]
+    # Same two-train limit as the legacy code, so both reject the same journeys
+    return (lambda: [ujd.scan_legs(legs, max_rail_legs=2) for legs in journeys]), len(journeys)
+
+
+def stage_process_journey(payload, raw):
+    journeys = payload["journeys"]
+
+    def run():
+        for idx, journey in enumerate(journeys, 1):
+            ujd.process_journey(journey, idx)
+    return run, len(journeys)
+
+
+def stage_serialize(payload, raw):
+    """Journey objects to the output dicts, as done once per write."""
+    journeys = ujd.process_journey_data(payload, len(payload["journeys"]), verbose=False)
+    return (lambda: [journey.to_dict() for journey in journeys]), max(1, len(journeys))
+
+
+def stage_pipeline(payload, raw):
+    """Decode plus process_journey_data over every journey in the response."""
+    count = len(payload["journeys"])
+    return (lambda: ujd.process_journey_data(ujd.json_loads(raw), count, verbose=False)), count
+
+
+def stage_first_journeys(payload, raw):
+    """Whole-body decode, then processing until NUM_JOURNEYS are kept (the default fetch path)."""
+    target = ujd.NUM_JOURNEYS
+    return (lambda: ujd.process_journey_data(ujd.json_loads(raw), target, verbose=False)), target
+
+
+def stage_first_journeys_stream(payload, raw):
+    """Streamed decode that stops once NUM_JOURNEYS are kept (--stream)."""
+    target = ujd.NUM_JOURNEYS
+    size = ujd.STREAM_CHUNK_BYTES
+    chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+
+    def run():
+        journeys = ujd.iter_json_array(chunks)
+        try:
+            return ujd.process_journeys(journeys, target, verbose=False)
+        finally:
+            journeys.close()
+    return run, target
+
+
+def _backend_stages(backend):
+    """Decode and encode stages for one JSON backend, over the whole TFL payload."""
+    def decode(payload, raw):
+        return (lambda: backend.loads(raw)), len(payload["journeys"])
+
+    def encode(payload, raw):
+        return (lambda: backend.dumps(payload)), len(payload["journeys"])
+    return {f"decode_{backend.name}": decode, f"encode_{backend.name}": encode}
+
+
+STAGES = {
+    **{name: stage for backend in ujd.JSON_BACKENDS.values() for name, stage in _backend_stages(backend).items()},
+    "parse_datetime": stage_parse_datetime,
+    "timestamps_legacy": stage_timestamps_legacy,
+    "timestamps_cold": stage_timestamps_cold,
+    "timestamps": stage_timestamps,
+    "platform": stage_platform,
+    "platform_text_legacy": stage_platform_text_legacy,
+    "platform_text": stage_platform_text,
+    "classify_legacy": stage_classify_legacy,
+    "classify": stage_classify,
+    "process_journey": stage_process_journey,
+    "serialize": stage_serialize,
+    "pipeline": stage_pipeline,
+    "first_journeys": stage_first_journeys,
+    "first_journeys_stream": stage_first_journeys_stream,
+}
+
+
+# --- Measurement ---
+
+def measure(fn, ops, repeat=7, min_run_time=0.1):
+    """Best-of-`repeat` throughput in operations per second (GC disabled, as timeit does)."""
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            if time.perf_counter() - start >= min_run_time:
+                break
+            loops *= 2
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            best = min(best, (time.perf_counter() - start) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return ops / best
+
+
+def measure_allocations(fn, ops):
+    """Peak traced memory for one call, and the number of blocks it allocates per operation."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    new_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return peak / 1024, new_blocks / ops
+
+
+def run_benchmarks(scenarios=SCENARIOS, stages=STAGES):
+    results = {}
+    for scenario, options in scenarios.items():
+        payload = generate_journey_results(start=BENCH_START, seed=BENCH_SEED, **options)
+        raw = json.dumps(payload).encode()
+        print(f"\n{scenario}: {len(payload['journeys'])} journeys, {len(raw) / 1024:.0f} KiB")
+        print(f"  {'stage':<24}{'ops/sec':>14}{'us/op':>10}{'peak KiB':>11}{'blocks/op':>11}")
+        for name, stage in stages.items():
+            fn, ops = stage(payload, raw)
+            ops_per_sec = measure(fn, ops)
+            peak_kib, blocks_per_op = measure_allocations(fn, ops)
+            results[f"{scenario}/{name}"] = {
+                "ops_per_sec": round(ops_per_sec, 1),
+                "us_per_op": round(1e6 / ops_per_sec, 3),
+                "peak_kib": round(peak_kib, 1),
+                "blocks_per_op": round(blocks_per_op, 2),
+            }
+            print(f"  {name:<24}{ops_per_sec:>14,.0f}{1e6 / ops_per_sec:>10.2f}{peak_kib:>11.1f}{blocks_per_op:>11.2f}")
+    return results
+
+
+def check_against_baseline(results, path=BASELINE_FILE, tolerance=REGRESSION_TOLERANCE):
+    """Print a comparison with the stored baseline. Returns the regressed benchmark names."""
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    print(f"\nCompared with {path} (tolerance {tolerance:.0%}):")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"  {name:<32} new (no baseline)")
+            continue
+        ratio = result["ops_per_sec"] / baseline[name]["ops_per_sec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = "  <-- REGRESSION"
+        print(f"  {name:<32}{ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    with open(path, 'w') as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "results": results,
+        }, f, indent=2)
+        f.write("\n")
+    print(f"\n✓ Saved baseline to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the TFL journey processing path")
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES),
+                        help="Only run the given stage (repeatable)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Store results in {BASELINE_FILE}")
+    parser.add_argument("--check", action="store_true",
+                        help=f"Exit non-zero if any stage is more than {REGRESSION_TOLERANCE * 100:.0f}%% slower than the baseline")
+    args = parser.parse_args(argv)
+
+    stages = {name: STAGES[name] for name in args.stage} if args.stage else STAGES
+    results = run_benchmarks(stages=stages)
+
+    if args.check:
+        regressions = check_against_baseline(results)
+        if regressions:
+            print(f"\n⚠ {len(regressions)} benchmark(s) regressed")
+            return 1
+    if args.save_baseline:
+        save_baseline(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import update_journey_data as ujd  # noqa: E402
+
+ENDPOINT = "Journey/JourneyResults"
+PATH = "Journey/JourneyResults/A/to/B"
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b"{}"
+    response.raw = mock.Mock()
+    response.url = f"{ujd.TFL_BASE_URL}/{PATH}"
+    return response
+
+
+class FakeSession:
+    """Hands out canned responses in order."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def get(self, url, **kwargs):
+        return self.responses.pop(0)
+
+
+class HalfOpenThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = ujd.CircuitBreaker(ENDPOINT, failure_threshold=2, reset_timeout=0.05)
+        patches = [
+            mock.patch.dict(ujd._breakers, {ENDPOINT: self.breaker}, clear=True),
+            mock.patch.object(ujd, "_rate_limiter", ujd.TokenBucket(60000, 100)),
+            mock.patch.object(ujd, "_hedger", None),
+            mock.patch.object(ujd, "backoff_delay", return_value=0),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_responses(self, *responses):
+        patcher = mock.patch.object(ujd, "get_session", return_value=FakeSession(responses))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttled_trial_does_not_wedge_breaker(self):
+        self.use_responses(
+            make_response(503),
+            make_response(503),
+            make_response(429, {"Retry-After": "0"}),
+            make_response(200),
+            make_response(200),
+        )
+        with self.assertRaises(ujd.CircuitOpenError):
+            ujd.tfl_get(PATH)
+        self.assertEqual(self.breaker.state, "open")
+
+        time.sleep(self.breaker.reset_timeout + 0.01)
+        self.assertEqual(ujd.tfl_get(PATH).status_code, 200)
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(ujd.tfl_get(PATH).status_code, 200)
+
+    def test_throttled_trial_on_last_attempt_releases_trial(self):
+        self.use_responses(
+            make_response(503),
+            make_response(503),
+            make_response(429, {"Retry-After": "0"}),
+            make_response(200),
+            make_response(200),
+        )
+        with self.assertRaises(ujd.CircuitOpenError):
+            ujd.tfl_get(PATH)
+        time.sleep(self.breaker.reset_timeout + 0.01)
+
+        with mock.patch.object(ujd, "TFL_MAX_RETRIES", 0):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                ujd.tfl_get(PATH)
+            self.assertEqual(ujd.tfl_get(PATH).status_code, 200)
+            self.assertEqual(ujd.tfl_get(PATH).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import update_journey_data as ujd  # noqa: E402
+
+# Instruction strings seen in TFL legs, with the platform the fallback parser should find.
+# Also timed by benchmark_processing.py's platform_text stages.
+PLATFORM_CORPUS = [
+    ("Southern to Imperial Wharf Rail Station", None),
+    ("Southern towards Milton Keynes Central", None),
+    ("London Overground towards Clapham Junction", None),
+    ("Southern towards London Victoria from Platform 2", "2"),
+    ("Take the Southern train from platform 1a", "1A"),
+    ("Board at Platform 12a towards Watford Junction", "12A"),
+    ("Change at Clapham Junction for platforms 3 and 4", "3/4"),
+    ("Trains depart from Platforms 9, 10", "9/10"),
+    ("Departs from Platform 3 or 4", "3/4"),
+    ("Departs Plat. 12", "12"),
+    ("Departs Plat 7", "7"),
+    ("Pl. 5 for Imperial Wharf", "5"),
+    ("Pl 2/3 for West Brompton", "2/3"),
+    ("Walk to platform no. 5", "5"),
+    ("London Overground from Platform B", "B"),
+    ("Continue along the platform and take the stairs", None),
+    ("Walk to Clapham Junction Rail Station", None),
+    ("Exit via the platform 17 footbridge", "17"),
+    ("PLATFORM 16 - Southern towards Croydon", "16"),
+    ("Use the replatformed entrance on Falcon Road", None),
+    ("Southern (Govia Thameslink Railway plc) towards Brighton", None),
+    ("Walk along Plough Road to Clapham Junction", None),
+    ("Southern towards East Croydon from platform 2 or a later train", "2"),
+    ("Change at Clapham Junction for platform 4 & a Southern train to Victoria", "4"),
+    ("Change at Clapham Junction for Platforms 3-4", "3/4"),
+    ("London Overground from Platforms A and B", "A/B"),
+    ("", None),
+]
+
+
+class ExtractPlatformTest(unittest.TestCase):
+    def test_corpus(self):
+        for text, expected in PLATFORM_CORPUS:
+            with self.subTest(text=text):
+                self.assertEqual(ujd.extract_platform_from_instruction(text), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+Local stand-in for the TFL API, for load testing the updater without touching the real service.
+
+    python tfl_stub_server.py --port 8765 --latency lognormal --latency-ms 300 --error-rate 0.02
+    TFL_BASE_URL=http://127.0.0.1:8765 python update_journey_data.py --routes routes.json
+
+Serves synthetic /Journey/JourneyResults/{from}/to/{to} responses with configurable
+latency, server errors, dropped connections, 429 throttling and payload size.
+GET /__stats returns request counts by status.
+"""
+import math
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlsplit, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tfl_synthetic import STATIONS, generate_payload_bytes
+from update_journey_data import TokenBucket
+
+
+class StubConfig:
+    """Behaviour knobs shared by all request handlers."""
+
+    def __init__(self, args):
+        self.latency = args.latency
+        self.latency_ms = args.latency_ms
+        self.latency_sigma = args.latency_sigma
+        self.error_rate = args.error_rate
+        self.reset_rate = args.reset_rate
+        self.throttle = TokenBucket(args.rate_limit, args.rate_burst) if args.rate_limit else None
+        self.retry_after = math.ceil(60 / args.rate_limit) if args.rate_limit else 0
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.payloads = self._build_payloads(args)
+
+    @staticmethod
+    def _build_payloads(args):
+        """Pre-generate a few payload variants so serving costs no CPU per request."""
+        print(f"Generating {args.variants} payload variant(s) with {args.journeys} journeys each...")
+        payloads = [
+            generate_payload_bytes(num_journeys=args.journeys, rail_legs=(1, args.max_rail_legs),
+                                   path_points=args.path_points, delay_rate=args.delay_rate, seed=seed)
+            for seed in range(args.variants)
+        ]
+        print(f"Payload size: {sum(len(p) for p in payloads) / len(payloads) / 1024:.0f} KiB")
+        return payloads
+
+    def sample_latency(self):
+        """Seconds to wait before answering."""
+        ms = self.latency_ms
+        if self.latency == "fixed":
+            return ms / 1000
+        if self.latency == "uniform":
+            return random.uniform(0, 2 * ms) / 1000
+        # lognormal with median latency_ms: most requests are quick, a few are very slow
+        return random.lognormvariate(math.log(max(ms, 1)), self.latency_sigma) / 1000
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    config = None
+
+    def log_message(self, format, *args):
+        pass  # Per-request logging would dominate under load
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.config.count(status)
+
+    def _error(self, status, message, headers=None):
+        body = json.dumps({
+            "$type": "Tfl.Api.Presentation.Entities.ApiError, Tfl.Api.Presentation.Entities",
+            "timestampUtc": datetime.utcnow().isoformat() + "Z",
+            "httpStatusCode": status,
+            "message": message,
+        }).encode()
+        self._send(status, body, headers)
+
+    def do_GET(self):
+        config = self.config
+        path = unquote(urlsplit(self.path).path).strip("/")
+
+        if path == "__stats":
+            with config.stats_lock:
+                body = json.dumps({str(k): v for k, v in config.stats.items()}).encode()
+            self._send(200, body)
+            return
+
+        parts = path.split("/")
+        if len(parts) != 5 or parts[:2] != ["Journey", "JourneyResults"] or parts[3] != "to":
+            self._error(404, f"No endpoint matches {path}")
+            return
+
+        if config.throttle is not None and not config.throttle.try_acquire():
+            self._error(429, "Rate limit exceeded", {"Retry-After": str(config.retry_after)})
+            return
+
+        time.sleep(config.sample_latency())
+
+        roll = random.random()
+        if roll < config.reset_rate:
+            config.count("reset")
+            self.close_connection = True  # Drop the socket without answering
+            return
+        if roll < config.reset_rate + config.error_rate:
+            self._error(random.choice([500, 502, 503]), "Simulated server error")
+            return
+
+        self._send(200, random.choice(config.payloads))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the TFL Journey Planner API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="Latency distribution (default: %(default)s)")
+    parser.add_argument("--latency-ms", type=float, default=200,
+                        help="Fixed/mean/median latency in milliseconds (default: %(default)s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.6,
+                        help="Spread of the lognormal distribution; larger = longer tail (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 5xx")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="Share of connections dropped without a response")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="Requests per minute before answering 429 with Retry-After (0 = unlimited)")
+    parser.add_argument("--rate-burst", type=int, default=20)
+    parser.add_argument("--journeys", type=int, default=10, help="Journeys per response (default: %(default)s)")
+    parser.add_argument("--max-rail-legs", type=int, default=2, help="Maximum rail legs per journey")
+    parser.add_argument("--path-points", type=int, default=40, help="Coordinates per leg path; controls payload size")
+    parser.add_argument("--delay-rate", type=float, default=0.1, help="Share of legs reported as delayed")
+    parser.add_argument("--variants", type=int, default=4, help="Distinct payloads to rotate through")
+    args = parser.parse_args(argv)
+
+    StubHandler.config = StubConfig(args)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"TFL stub listening on http://{args.host}:{args.port} "
+          f"(e.g. /Journey/JourneyResults/{STATIONS[0][1]}/to/{STATIONS[6][1]})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests by status: {dict(StubHandler.config.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import json
+import random
+import zlib
+from datetime import datetime, timedelta
+
+# --- Synthetic TFL Journey/JourneyResults payloads ---
+# Used by the benchmarks and the local TFL stand-in server. Payloads mimic the
+# shape of real Journey Planner responses (the fields update_journey_data.py reads,
+# plus the bulky path/stop data that makes real responses large).
+
+STATIONS = [
+    ("910GSTRHCOM", "Streatham Common Rail Station", 51.4188, -0.1359),
+    ("910GBALHAM", "Balham Rail Station", 51.4433, -0.1525),
+    ("910GWANDCMN", "Wandsworth Common Rail Station", 51.4462, -0.1633),
+    ("910GCLPHMJC", "Clapham Junction Rail Station", 51.4643, -0.1704),
+    ("910GSHEPBSH", "Shepherd's Bush Rail Station", 51.5053, -0.2174),
+    ("910GWBRMPTN", "West Brompton Rail Station", 51.4872, -0.1956),
+    ("910GIMPERWF", "Imperial Wharf Rail Station", 51.4749, -0.1827),
+    ("910GVICTRIC", "London Victoria Rail Station", 51.4952, -0.1441),
+]
+
+OPERATORS = {
+    "national-rail": ["Southern", "South Western Railway", "Thameslink"],
+    "overground": ["London Overground", "Mildmay"],
+    "bus": ["G1", "57", "249"],
+    "tube": ["Northern", "District"],
+}
+
+DEFAULT_MODE_WEIGHTS = {"national-rail": 0.6, "overground": 0.3, "bus": 0.05, "tube": 0.05}
+
+# Where the platform for a leg is reported, mirroring the lookup order in get_platform_from_leg
+PLATFORM_SHAPES = ["indicator", "platform", "platformName", "platformNameBare", "instruction", "tbc", "none"]
+
+TYPE_PREFIX = "Tfl.Api.Presentation.Entities"
+
+
+def _fmt(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _point(station, platform_shape, platform, delay_seconds=0):
+    naptan, name, lat, lon = station
+    point = {
+        "$type": f"{TYPE_PREFIX}.JourneyPlanner.Point, Tfl.Api.Presentation.Entities",
+        "naptanId": naptan,
+        "platformName": "",
+        "icsCode": str(1000000 + zlib.crc32(naptan.encode()) % 100000),
+        "commonName": name,
+        "placeType": "StopPoint",
+        "additionalProperties": [],
+        "lat": lat,
+        "lon": lon,
+    }
+    if platform_shape == "indicator":
+        point["indicator"] = platform
+    elif platform_shape == "platform":
+        point["platform"] = platform
+    elif platform_shape == "platformName":
+        point["platformName"] = f"Platform {platform}"
+    elif platform_shape == "platformNameBare":
+        point["platformName"] = platform
+    elif platform_shape == "tbc":
+        point["indicator"] = "TBC"
+    if delay_seconds:
+        point["timing"] = {"arrivalDelay": delay_seconds}
+    return point
+
+
+def _path(start, end, points):
+    (_, _, lat1, lon1), (_, _, lat2, lon2) = start, end
+    coords = [
+        [round(lat1 + (lat2 - lat1) * i / max(1, points - 1), 5),
+         round(lon1 + (lon2 - lon1) * i / max(1, points - 1), 5)]
+        for i in range(points)
+    ]
+    return {
+        "$type": f"{TYPE_PREFIX}.JourneyPlanner.Path, Tfl.Api.Presentation.Entities",
+        "lineString": json.dumps(coords),
+        "stopPoints": [{"id": start[0], "name": start[1]}, {"id": end[0], "name": end[1]}],
+        "elevation": [],
+    }
+
+
+def _leg(rng, mode, start_station, end_station, depart, minutes, platform_shapes, delay_rate, path_points):
+    arrive = depart + timedelta(minutes=minutes)
+    operator = rng.choice(OPERATORS.get(mode, ["Walk"]))
+    dep_shape = rng.choice(platform_shapes)
+    arr_shape = rng.choice(platform_shapes)
+    dep_platform = f"{rng.randint(1, 17)}{rng.choice(['', '', '', 'a', 'b'])}"
+    arr_platform = f"{rng.randint(1, 17)}"
+    delay = rng.choice([90, 180, 420]) if mode != "walking" and rng.random() < delay_rate else 0
+
+    if mode == "walking":
+        summary = f"Walk to {end_station[1]}"
+        detailed = summary
+    else:
+        direction = rng.choice(STATIONS)[1]
+        summary = f"{operator} to {end_station[1]}"
+        detailed = f"{operator} towards {direction}"
+        if dep_shape == "instruction":
+            detailed += f" from Platform {dep_platform}"
+
+    leg = {
+        "$type": f"{TYPE_PREFIX}.JourneyPlanner.Leg, Tfl.Api.Presentation.Entities",
+        "duration": minutes,
+        "instruction": {"summary": summary, "detailed": detailed, "steps": []},
+        "obstacles": [],
+        "departureTime": _fmt(depart),
+        "arrivalTime": _fmt(arrive),
+        "scheduledDepartureTime": _fmt(depart),
+        "scheduledArrivalTime": _fmt(arrive),
+        "departurePoint": _point(start_station, dep_shape if mode != "walking" else "none", dep_platform),
+        "arrivalPoint": _point(end_station, arr_shape if mode != "walking" else "none", arr_platform, delay),
+        "path": _path(start_station, end_station, path_points),
+        "routeOptions": [] if mode == "walking" else [{
+            "$type": f"{TYPE_PREFIX}.JourneyPlanner.RouteOption, Tfl.Api.Presentation.Entities",
+            "name": operator,
+            "directions": [end_station[1]],
+            "lineIdentifier": {"id": operator.lower().replace(" ", "-"), "name": operator, "type": "Line"},
+        }],
+        "mode": {"id": mode, "name": mode, "type": "Mode", "routeType": "Unknown", "status": "Unknown"},
+        "disruptions": [],
+        "plannedWorks": [],
+        "isDisrupted": bool(delay),
+        "hasFixedLocations": mode != "walking",
+    }
+    return leg, arrive
+
+
+def generate_journey(rng, depart, origin, destination, rail_legs=1, mode_weights=None,
+                     platform_shapes=PLATFORM_SHAPES, delay_rate=0.1, path_points=40):
+    """Build one journey with `rail_legs` vehicle legs joined by short interchange walks."""
+    mode_weights = mode_weights or DEFAULT_MODE_WEIGHTS
+    modes, weights = zip(*mode_weights.items())
+    interchanges = [s for s in STATIONS if s not in (origin, destination)]
+    stops = [origin] + rng.sample(interchanges, min(rail_legs - 1, len(interchanges))) + [destination]
+
+    legs = []
+    current = depart
+    for i in range(len(stops) - 1):
+        if i:
+            walk, current = _leg(rng, "walking", stops[i], stops[i], current, rng.randint(2, 6),
+                                 platform_shapes, 0, 2)
+            legs.append(walk)
+            current += timedelta(minutes=rng.randint(0, 12))
+        mode = rng.choices(modes, weights)[0]
+        leg, current = _leg(rng, mode, stops[i], stops[i + 1], current, rng.randint(4, 20),
+                            platform_shapes, delay_rate, path_points)
+        legs.append(leg)
+
+    return {
+        "$type": f"{TYPE_PREFIX}.JourneyPlanner.Journey, Tfl.Api.Presentation.Entities",
+        "startDateTime": legs[0]["departureTime"],
+        "duration": int((current - depart).total_seconds() // 60),
+        "arrivalDateTime": legs[-1]["arrivalTime"],
+        "legs": legs,
+        "fare": {"totalCost": 320, "fares": [], "caveats": []},
+    }
+
+
+def generate_journey_results(num_journeys=10, rail_legs=(1, 2), mode_weights=None,
+                             platform_shapes=PLATFORM_SHAPES, delay_rate=0.1, path_points=40,
+                             origin=STATIONS[0], destination=STATIONS[6], start=None, seed=None):
+    """
+    Build a Journey/JourneyResults style payload.
+    rail_legs is a (min, max) range of vehicle legs per journey; mode_weights maps
+    TFL mode names to relative frequencies; platform_shapes lists where platforms
+    may be reported (see PLATFORM_SHAPES); path_points controls payload bulk.
+    """
+    rng = random.Random(seed)
+    start = start or datetime.now().replace(second=0, microsecond=0)
+    journeys = []
+    for i in range(num_journeys):
+        depart = start + timedelta(minutes=5 * i + rng.randint(0, 4))
+        journeys.append(generate_journey(
+            rng, depart, origin, destination, rng.randint(*rail_legs), mode_weights,
+            platform_shapes, delay_rate, path_points,
+        ))
+
+    return {
+        "$type": f"{TYPE_PREFIX}.JourneyPlanner.ItineraryResult, Tfl.Api.Presentation.Entities",
+        "journeys": journeys,
+        "lines": [],
+        "stopMessages": [],
+        "recommendedMaxAgeMinutes": 1,
+        "searchCriteria": {"dateTime": _fmt(start), "dateTimeType": "Departing"},
+        "journeyVector": {"from": origin[0], "to": destination[0], "via": "", "uri": ""},
+    }
+
+
+def generate_payload_bytes(**kwargs):
+    """Encoded payload, as the API would send it."""
+    return json.dumps(generate_journey_results(**kwargs)).encode()
@@ -1,26 +1,1347 @@
 import os
+import re
 import json
+import time
+import random
+import signal
+import argparse
+import asyncio
+import sqlite3
+import gzip
+import codecs
+import hashlib
+import threading
 import requests
-from datetime import datetime, timedelta
+try:
+    import tomllib  # Python 3.11+, only needed for TOML routes files
+except ImportError:
+    tomllib = None
+try:
+    import orjson  # Optional, faster JSON decoding and encoding
+except ImportError:
+    orjson = None
+try:
+    import brotli  # Optional, only needed for .br siblings of compact output
+except ImportError:
+    brotli = None
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # --- Configuration ---
 TFL_APP_ID = os.getenv("TFL_APP_ID", "")
 TFL_APP_KEY = os.getenv("TFL_APP_KEY", "")
 OUTPUT_FILE = "live_data.json"
+METRICS_FILE = os.getenv("METRICS_FILE", "live_metrics.json")  # Per-stage timings; empty disables
+# "pretty" (indented JSON) or "compact" (minified JSON plus pre-compressed .gz/.br siblings)
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "pretty")
+OUTPUT_MANIFEST = os.getenv("OUTPUT_MANIFEST", "live_manifest.json")  # Compact mode: sizes and hashes of outputs
 
 # Journey parameters
 ORIGIN = "Streatham Common Rail Station"
 DESTINATION = "Imperial Wharf Rail Station"
 
+# Optional routes file (JSON or TOML) listing many origin/destination pairs.
+# When unset, the single ORIGIN/DESTINATION route above is refreshed into OUTPUT_FILE.
+ROUTES_FILE = os.getenv("ROUTES_FILE", "")
+
 # TFL API endpoint
-TFL_BASE_URL = "https://api.tfl.gov.uk"
+TFL_BASE_URL = os.getenv("TFL_BASE_URL", "https://api.tfl.gov.uk")  # Override to point at tfl_stub_server.py
 NUM_JOURNEYS = 4 # Target the next four journeys
+TFL_TIMEOUT = float(os.getenv("TFL_TIMEOUT", "10"))
+# Decode the journeys array while it downloads and stop once enough journeys are kept
+TFL_STREAM = os.getenv("TFL_STREAM", "false").lower() == "true"
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", str(64 * 1024)))
+
+# Shared HTTP session (connection pooling / keep-alive)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # Number of per-host pools kept
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))  # Max open sockets per host
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "true").lower() == "true"  # Wait for a free socket instead of opening extras
+HTTP_KEEP_ALIVE = os.getenv("HTTP_KEEP_ALIVE", "true").lower() == "true"
+
+# TFL API quota (shared token bucket). Set TFL_RATE_LIMIT_DB to share it between processes.
+TFL_RATE_LIMIT = float(os.getenv("TFL_RATE_LIMIT", "500"))  # Requests per minute
+TFL_RATE_BURST = int(os.getenv("TFL_RATE_BURST", "20"))  # Requests allowed back-to-back
+TFL_RATE_LIMIT_DB = os.getenv("TFL_RATE_LIMIT_DB", "")  # SQLite file; empty = in-process only
+TFL_DEFAULT_RETRY_AFTER = 5.0  # Seconds to back off on a 429 without a usable Retry-After header
+
+# Retries (timeouts, connection errors, 5xx, 429) and per-endpoint circuit breaker
+TFL_MAX_RETRIES = int(os.getenv("TFL_MAX_RETRIES", "3"))
+TFL_RETRY_BASE_DELAY = float(os.getenv("TFL_RETRY_BASE_DELAY", "0.5"))  # First backoff step in seconds
+TFL_RETRY_MAX_DELAY = float(os.getenv("TFL_RETRY_MAX_DELAY", "8"))  # Backoff cap in seconds
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Consecutive failures to open
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # Seconds before a trial request
+
+# Hedged requests: re-send a slow request once it exceeds a latency percentile
+TFL_HEDGE = os.getenv("TFL_HEDGE", "false").lower() == "true"
+TFL_HEDGE_PERCENTILE = float(os.getenv("TFL_HEDGE_PERCENTILE", "95"))  # Hedge after this observed latency percentile
+TFL_HEDGE_MAX_RATIO = float(os.getenv("TFL_HEDGE_MAX_RATIO", "0.1"))  # Extra requests allowed, as a share of all requests
+TFL_HEDGE_MIN_SAMPLES = 20  # Latencies to observe before hedging starts
+
+# Journey response cache (in-memory LRU, optionally mirrored on disk)
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))  # Seconds a response stays fresh; 0 disables caching
+CACHE_BUCKET_SECONDS = int(os.getenv("CACHE_BUCKET_SECONDS", "60"))  # Queries in the same window share an entry
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # In-memory cap (raw response bytes)
+CACHE_DIR = os.getenv("CACHE_DIR", "")  # Empty = memory only
+
+# Opt-in archive of raw TFL responses (gzip segments + JSON-lines index)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")  # Empty = archiving disabled
+ARCHIVE_SEGMENT_BYTES = int(os.getenv("ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))  # Rotate after this size
+ARCHIVE_MAX_SEGMENTS = int(os.getenv("ARCHIVE_MAX_SEGMENTS", "0"))  # Oldest segments dropped beyond this; 0 = keep all
+
+# Learned platforms, used to predict platforms TFL still reports as "TBC"
+PLATFORM_CACHE_FILE = os.getenv("PLATFORM_CACHE_FILE", "")  # JSON file; empty = memory only
+PLATFORM_CACHE_MAX_AGE_DAYS = int(os.getenv("PLATFORM_CACHE_MAX_AGE_DAYS", "28"))  # Forget platforms not seen since
+
+# Journeys with more train legs than this are skipped; 0 = any number of changes
+MAX_RAIL_LEGS = int(os.getenv("MAX_RAIL_LEGS", "0"))
+
+# JSON implementation for API responses, the archive and output files: auto (orjson if installed), orjson or json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Maximum number of journey-planner requests in flight when refreshing many routes
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+
+# Prometheus text-format metrics endpoint (daemon mode only); 0 disables
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+# Memoised timestamp parsing (the same TFL timestamps recur across journeys and cycles)
+TIMESTAMP_CACHE_SIZE = int(os.getenv("TIMESTAMP_CACHE_SIZE", "8192"))
+
+# Daemon mode scheduling (seconds between cycles, +/- random jitter)
+UPDATE_INTERVAL = float(os.getenv("UPDATE_INTERVAL", "300"))
+UPDATE_JITTER = float(os.getenv("UPDATE_JITTER", "15"))
+REVALIDATE_MIN_DELAY = float(os.getenv("REVALIDATE_MIN_DELAY", "15"))  # First retry delay after a failed refresh
+
+# --- HTTP Session ---
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                   pool_block=HTTP_POOL_BLOCK, keep_alive=HTTP_KEEP_ALIVE):
+    """Build a requests Session with a sized connection pool for TFL calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+    return session
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def configure_session(**kwargs):
+    """Replace the shared session (e.g. with different pool limits)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(**kwargs)
+    return _session
+
+
+def ensure_pool_size(pool_maxsize):
+    """Grow the shared session's pool to at least pool_maxsize, keeping it (and its sockets) if it is already big enough."""
+    adapter = get_session().get_adapter(TFL_BASE_URL)
+    if getattr(adapter, "_pool_maxsize", 0) < pool_maxsize:
+        configure_session(pool_maxsize=pool_maxsize)
+
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill at `rate_per_minute` up to `burst`;
+    acquire() blocks until a token is available. pause() holds every caller back,
+    e.g. when TFL answers 429 with a Retry-After.
+    """
+
+    def __init__(self, rate_per_minute, burst):
+        if rate_per_minute <= 0 or burst < 1:
+            raise ValueError("Rate limit must be positive and burst at least 1")
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._state = (float(self.burst), self._now(), 0.0)  # (tokens, updated_at, paused_until)
+
+    def _now(self):
+        return time.monotonic()
+
+    def _load(self):
+        return self._state
+
+    def _store(self, state):
+        self._state = state
+
+    def _transaction(self):
+        return self._lock
+
+    def _take(self):
+        """Take a token if possible. Returns 0 on success or the seconds to wait."""
+        with self._transaction():
+            tokens, updated_at, paused_until = self._load()
+            now = self._now()
+            tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+            if now < paused_until:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._store((tokens, now, paused_until))
+            return wait
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """Take a token only if one is available right now."""
+        return self._take() <= 0
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (never shortens an existing pause)."""
+        with self._transaction():
+            tokens, updated_at, paused_until = self._load()
+            self._store((tokens, updated_at, max(paused_until, self._now() + seconds)))
+
+
+class SqliteTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in a SQLite file so several updater processes
+    share one TFL quota. Uses wall-clock time since monotonic clocks differ per process.
+    """
+
+    def __init__(self, db_path, rate_per_minute, burst, name="tfl"):
+        self.db_path = db_path
+        self.name = name
+        self._local = threading.local()
+        super().__init__(rate_per_minute, burst)
+
+    def _init_state(self):
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL, updated_at REAL, paused_until REAL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO token_buckets VALUES (?, ?, ?, 0)",
+                (self.name, float(self.burst), self._now()),
+            )
+
+    def _now(self):
+        return time.time()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return _SqliteTransaction(conn)
+
+    def _transaction(self):
+        return self._connection()
+
+    def _load(self):
+        row = self._local.conn.execute(
+            "SELECT tokens, updated_at, paused_until FROM token_buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        return row if row else (float(self.burst), self._now(), 0.0)
+
+    def _store(self, state):
+        self._local.conn.execute(
+            "INSERT OR REPLACE INTO token_buckets VALUES (?, ?, ?, ?)", (self.name, *state)
+        )
+
+
+class _SqliteTransaction:
+    """Context manager holding an exclusive (IMMEDIATE) SQLite write transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def configure_rate_limiter(rate_per_minute=TFL_RATE_LIMIT, burst=TFL_RATE_BURST, db_path=TFL_RATE_LIMIT_DB):
+    """Install the limiter shared by every TFL request."""
+    global _rate_limiter
+    if db_path:
+        _rate_limiter = SqliteTokenBucket(db_path, rate_per_minute, burst)
+    else:
+        _rate_limiter = TokenBucket(rate_per_minute, burst)
+    return _rate_limiter
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter, creating it from the environment on first use."""
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                configure_rate_limiter()
+    return _rate_limiter
+
+
+def parse_retry_after(value, default=TFL_DEFAULT_RETRY_AFTER):
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# --- Retries & Circuit Breaker ---
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling TFL while an endpoint's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker. After `failure_threshold` consecutive failures the
+    circuit opens and calls fail fast; after `reset_timeout` one trial request is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half-open"
+                self._trial_in_flight = False
+            if self.state == "half-open":
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"[{datetime.now().isoformat()}] Circuit for {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                print(f"[{datetime.now().isoformat()}] Circuit for {self.name} opened after "
+                      f"{self.failures} failures; pausing calls for {self.reset_timeout:.0f}s")
+
+    def release_trial(self):
+        """Settle a request that neither succeeded nor failed (e.g. a 429) so the next call can be the trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint):
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def _endpoint_name(path):
+    """Group requests by API endpoint, e.g. 'Journey/JourneyResults/A/to/B' -> 'Journey/JourneyResults'."""
+    return "/".join(path.strip("/").split("/")[:2])
+
+
+def classify_failure(error=None, status_code=None):
+    """Return the retryable failure class for a request outcome, or None if it should not be retried."""
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"  # Includes refused and reset connections
+    if status_code == 429:
+        return "throttled"
+    if status_code is not None and status_code >= 500:
+        return "server_error"
+    return None
+
+
+def backoff_delay(attempt, base=TFL_RETRY_BASE_DELAY, cap=TFL_RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# --- Hedged Requests ---
+
+class Hedger:
+    """
+    Sends a duplicate of a request that has not answered within the observed
+    `percentile` latency and returns whichever copy finishes first. Duplicates are
+    capped at `max_ratio` of all requests and must get a rate-limiter token immediately.
+    """
+
+    def __init__(self, percentile=TFL_HEDGE_PERCENTILE, max_ratio=TFL_HEDGE_MAX_RATIO,
+                 min_samples=TFL_HEDGE_MIN_SAMPLES, window=500):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="tfl-hedge")
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def threshold(self):
+        """Current hedge delay in seconds, or None until enough latencies are observed."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    def _timed(self, request_fn):
+        start = time.monotonic()
+        response = request_fn()
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return response
+
+    def _may_hedge(self, limiter):
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.requests:
+                return False
+        if not limiter.try_acquire():
+            return False
+        with self._lock:
+            self.hedges += 1
+        return True
+
+    def send(self, request_fn, limiter):
+        with self._lock:
+            self.requests += 1
+        delay = self.threshold()
+        if delay is None:
+            return self._timed(request_fn)
+
+        primary = self._executor.submit(self._timed, request_fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._may_hedge(limiter):
+            return primary.result()
+
+        hedge = self._executor.submit(self._timed, request_fn)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                # The loser may have finished in the same wait() or still be running
+                for other in (done | pending) - {future}:
+                    other.add_done_callback(_close_response)
+                return future.result()
+        raise first_error
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+def _close_response(future):
+    """Release the connection held by a losing hedged request."""
+    if future.exception() is None:
+        future.result().close()
+
+
+_hedger = None
+
+
+def configure_hedging(enabled=TFL_HEDGE, percentile=TFL_HEDGE_PERCENTILE, max_ratio=TFL_HEDGE_MAX_RATIO):
+    """Enable or disable hedged requests for every TFL call."""
+    global _hedger
+    _hedger = Hedger(percentile, max_ratio) if enabled else None
+    return _hedger
+
+
+def _send(request_fn, limiter):
+    """Run a request, hedging it when hedging is enabled."""
+    hedger = _hedger
+    if hedger is None:
+        return request_fn()
+    return hedger.send(request_fn, limiter)
+
+
+def _raise_for_status(response):
+    """raise_for_status(), closing the response first so an unread streamed body frees its socket."""
+    if not response.ok:
+        response.close()
+        response.raise_for_status()
+
+
+def tfl_get(path, params=None, timeout=TFL_TIMEOUT, stream=False):
+    """
+    Single entry point for every TFL API call. Adds credentials, waits for the
+    shared rate limiter and sends the request through the pooled session.
+    Timeouts, connection errors and 5xx are retried with jittered backoff, a 429
+    pauses the limiter for Retry-After, and the endpoint's circuit breaker fails
+    fast while TFL keeps failing. Raises for HTTP errors.
+    With stream=True the body is not read; the caller must close the response.
+    """
+    url = f"{TFL_BASE_URL}/{path.lstrip('/')}"
+    params = dict(params or {})
+    
+    if TFL_APP_ID and TFL_APP_KEY:
+        params["app_id"] = TFL_APP_ID
+        params["app_key"] = TFL_APP_KEY
+
+    endpoint = _endpoint_name(path)
+    breaker = get_circuit_breaker(endpoint)
+    limiter = get_rate_limiter()
+
+    for attempt in range(TFL_MAX_RETRIES + 1):
+        if not breaker.allow():
+            api_requests.inc(endpoint=endpoint, status="circuit_open")
+            raise CircuitOpenError(f"Circuit open for {endpoint}, skipping request")
+        limiter.acquire()
+
+        error = response = None
+        start = time.perf_counter()
+        try:
+            response = _send(lambda: get_session().get(url, params=params, timeout=timeout, stream=stream), limiter)
+        except requests.exceptions.RequestException as e:
+            error = e
+        except BaseException:
+            breaker.release_trial()
+            raise
+        api_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+
+        reason = classify_failure(error, response.status_code if response is not None else None)
+        api_requests.inc(endpoint=endpoint, status=response.status_code if response is not None else (reason or "error"))
+        if reason is None:
+            if error is not None:
+                breaker.record_failure()
+                raise error
+            breaker.record_success()  # TFL answered; 4xx errors are ours, not an outage
+            _raise_for_status(response)
+            return response
+
+        if reason == "throttled":
+            breaker.release_trial()  # TFL is up but busy: not a failure, but the half-open trial is over
+        else:
+            breaker.record_failure()
+        if attempt == TFL_MAX_RETRIES:
+            if error is not None:
+                raise error
+            _raise_for_status(response)
+
+        if reason == "throttled":
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            print(f"WARNING: TFL rate limit hit (429), pausing requests for {retry_after:.1f}s")
+            limiter.pause(retry_after)
+        else:
+            delay = backoff_delay(attempt)
+            print(f"WARNING: TFL request failed ({reason}), retry {attempt + 1}/{TFL_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+        if response is not None:
+            response.close()
+
+# --- JSON Backend ---
+
+class JsonBackend:
+    """A JSON implementation: loads() accepts str or bytes, dumps() returns UTF-8 bytes."""
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _stdlib_dumps(obj, pretty=False):
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _orjson_dumps(obj, pretty=False):
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+
+# Both write compact JSON, or JSON indented by two spaces when pretty; the output only
+# differs in float exponents (1e-07 vs 1e-7)
+JSON_BACKENDS = {"json": JsonBackend("json", json.loads, _stdlib_dumps)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = JsonBackend("orjson", orjson.loads, _orjson_dumps)
+
+_json_backend = None
+
+
+def configure_json_backend(name=JSON_BACKEND):
+    """Select the JSON backend by name; "auto" prefers orjson when it is installed."""
+    global _json_backend
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_BACKENDS else "json"
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available (installed: {', '.join(JSON_BACKENDS)})")
+    _json_backend = JSON_BACKENDS[name]
+    return _json_backend
+
+
+def get_json_backend():
+    if _json_backend is None:
+        configure_json_backend()
+    return _json_backend
+
+
+def json_loads(data):
+    return get_json_backend().loads(data)
+
+
+def json_dumps(obj, pretty=False):
+    return get_json_backend().dumps(obj, pretty)
+
+# --- Response Cache ---
+
+class ResponseCache:
+    """
+    TTL cache for decoded TFL responses. Entries live in an LRU-ordered dict capped
+    at `max_bytes` of raw response size; with `directory` set, raw bodies are also
+    kept on disk so separate runs and processes can reuse them.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()  # key -> (expires_at, size, data)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @staticmethod
+    def make_key(path, params, now=None, bucket_seconds=CACHE_BUCKET_SECONDS):
+        """Normalise a query (case, whitespace, param order) plus its time window into a key."""
+        now = time.time() if now is None else now
+        norm_path = " ".join(path.split()).lower()
+        norm_params = "&".join(f"{k.lower()}={str(v).strip().lower()}" for k, v in sorted(params.items()))
+        window = int(now // bucket_seconds) if bucket_seconds > 0 else 0
+        return hashlib.sha256(f"{norm_path}?{norm_params}@{window}".encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def get(self, key):
+        """Return cached data or None. Expired entries are dropped."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+
+        data = self._read_disk(key, now)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        return data
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at = float(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if expires_at <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            data = json_loads(body)
+        except ValueError:
+            return None
+        self._store(key, expires_at, len(body), data)
+        return data
+
+    def put(self, key, data, raw_body):
+        """Cache a response; `raw_body` is the undecoded bytes (used for sizing and disk)."""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._store(key, expires_at, len(raw_body), data)
+        if self.directory:
+            tmp_path = f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(f"{expires_at}\n".encode())
+                    f.write(raw_body)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                print(f"WARNING: Could not write cache entry: {e}")
+
+    def _store(self, key, expires_at, size, data):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, data)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def purge_expired(self):
+        """Drop expired entries from memory and disk."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[0] <= now]:
+                self._remove(key)
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if not name.endswith(".cache"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, 'rb') as f:
+                        expired = float(f.readline()) <= now
+                    if expired:
+                        os.remove(path)
+                except (OSError, ValueError):
+                    continue
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+_response_cache = None
+
+
+def configure_response_cache(ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR):
+    """Install the cache used by get_journey_plan."""
+    global _response_cache
+    _response_cache = ResponseCache(ttl, max_bytes, directory)
+    return _response_cache
+
+
+def get_response_cache():
+    if _response_cache is None:
+        configure_response_cache()
+    return _response_cache
+
+# --- Raw Response Archive ---
+
+class ResponseArchive:
+    """
+    Append-only archive of raw TFL response bodies. Each body is written as its own
+    gzip member to the current segment file, so bytes are stored exactly as received
+    and single responses can be read back by offset. Segments rotate at
+    `segment_bytes`; `index.jsonl` records route, time, segment, offset and length.
+    Intended for a single writing process.
+    """
+
+    INDEX_NAME = "index.jsonl"
+
+    def __init__(self, directory, segment_bytes=ARCHIVE_SEGMENT_BYTES, max_segments=ARCHIVE_MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self._segment = segments[-1] if segments else self._segment_name(1)
+
+    @staticmethod
+    def _segment_name(number):
+        return f"segment-{number:06d}.gz"
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, self.INDEX_NAME)
+
+    def segments(self):
+        return sorted(n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".gz"))
+
+    def append(self, origin, destination, raw_body, fetched_at=None):
+        """Store one raw response body and index it."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        member = gzip.compress(raw_body, mtime=0)
+
+        with self._lock:
+            path = os.path.join(self.directory, self._segment)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size and size + len(member) > self.segment_bytes:
+                self._rotate()
+                path = os.path.join(self.directory, self._segment)
+
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(member)
+
+            entry = {
+                "origin": origin,
+                "destination": destination,
+                "fetched_at": round(fetched_at, 3),
+                "segment": self._segment,
+                "offset": offset,
+                "length": len(member),
+                "size": len(raw_body),
+            }
+            with open(self.index_path, 'ab') as f:
+                f.write(json_dumps(entry) + b"\n")
+
+    def _rotate(self):
+        number = int(self._segment[len("segment-"):-len(".gz")]) + 1
+        self._segment = self._segment_name(number)
+        if not self.max_segments:
+            return
+
+        # Keep the new segment plus the newest (max_segments - 1) existing ones
+        segments = self.segments()
+        dropped = set(segments[:max(0, len(segments) - (self.max_segments - 1))])
+        if not dropped:
+            return
+        for name in dropped:
+            os.remove(os.path.join(self.directory, name))
+        kept = [line for line in self._read_index_lines() if json_loads(line)["segment"] not in dropped]
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(kept)
+        os.replace(tmp_path, self.index_path)
+
+    def _read_index_lines(self):
+        try:
+            with open(self.index_path) as f:
+                return [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def entries(self, origin=None, destination=None, since=None, until=None):
+        """Yield index entries, optionally filtered by route and fetch time (epoch seconds)."""
+        for line in self._read_index_lines():
+            entry = json_loads(line)
+            if origin is not None and entry["origin"] != origin:
+                continue
+            if destination is not None and entry["destination"] != destination:
+                continue
+            if since is not None and entry["fetched_at"] < since:
+                continue
+            if until is not None and entry["fetched_at"] > until:
+                continue
+            yield entry
+
+    def read(self, entry):
+        """Return the raw response bytes for an index entry."""
+        with open(os.path.join(self.directory, entry["segment"]), 'rb') as f:
+            f.seek(entry["offset"])
+            return gzip.decompress(f.read(entry["length"]))
+
+
+_archive = None
+
+
+def configure_archive(directory=ARCHIVE_DIR):
+    """Enable the raw response archive in `directory` (None/empty disables it)."""
+    global _archive
+    _archive = ResponseArchive(directory) if directory else None
+    return _archive
+
+# --- Learned Platforms ---
+
+class PlatformCache:
+    """
+    Platforms TFL has announced, keyed by (station, line, direction, scheduled time).
+    Timetabled services normally use the same platform every day, so a platform seen
+    once is served as a prediction while later queries for the service still say
+    "TBC". Each platform counts the days it was seen; the most frequent one wins.
+    With `path` set the cache is loaded from and saved to a JSON file.
+    """
+
+    def __init__(self, path=PLATFORM_CACHE_FILE, max_age_days=PLATFORM_CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age_days = max_age_days
+        self._entries = {}  # key -> {platform: {"days": n, "last_seen": "YYYY-MM-DD"}}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.predicted = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read platform cache {self.path}: {e}")
+            return
+        if isinstance(entries, dict):
+            self._entries = entries
+
+    @staticmethod
+    def make_key(leg, is_departure):
+        """Key for the service a leg departs or arrives with, or None if the leg lacks the details."""
+        point = leg.get('departurePoint' if is_departure else 'arrivalPoint') or {}
+        station = point.get('naptanId') or point.get('commonName')
+        if is_departure:
+            scheduled = leg.get('scheduledDepartureTime') or leg.get('departureTime')
+        else:
+            scheduled = leg.get('scheduledArrivalTime') or leg.get('arrivalTime')
+        when = parse_datetime(scheduled)
+        route_options = leg.get('routeOptions') or [{}]
+        line = (route_options[0].get('lineIdentifier') or {}).get('id') or route_options[0].get('name')
+        if not (station and line and when):
+            return None
+        direction = (route_options[0].get('directions') or [""])[0]
+        day_type = ("weekday", "weekday", "weekday", "weekday", "weekday", "saturday", "sunday")[when.weekday()]
+        return "|".join((station, line, direction, "dep" if is_departure else "arr",
+                         day_type, _format_hh_mm(when)))
+
+    def record(self, key, platform, day=None):
+        """Remember an announced platform for a service (counted at most once per day)."""
+        day = day or datetime.now().date().isoformat()
+        with self._lock:
+            seen = self._entries.setdefault(key, {}).setdefault(platform, {"days": 0, "last_seen": ""})
+            if seen["last_seen"] != day:
+                seen["days"] += 1
+                seen["last_seen"] = day
+                self._dirty = True
+            self.recorded += 1
+
+    def predict(self, key):
+        """Most frequently seen platform for a service, or None."""
+        with self._lock:
+            seen = self._entries.get(key)
+            if not seen:
+                self.misses += 1
+                return None
+            self.predicted += 1
+            return max(seen, key=lambda p: (seen[p]["days"], seen[p]["last_seen"]))
+
+    def purge_expired(self, today=None):
+        """Drop platforms not seen within max_age_days."""
+        today = today or datetime.now().date()
+        cutoff = (today - timedelta(days=self.max_age_days)).isoformat()
+        with self._lock:
+            for key in list(self._entries):
+                seen = self._entries[key]
+                for platform in [p for p, s in seen.items() if s["last_seen"] < cutoff]:
+                    del seen[platform]
+                    self._dirty = True
+                if not seen:
+                    del self._entries[key]
+
+    def save(self):
+        """Write the cache to `path` if it changed since the last save."""
+        if not self.path:
+            return
+        self.purge_expired()
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._entries, f, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"WARNING: Could not write platform cache {self.path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "services": len(self._entries),
+                "recorded": self.recorded,
+                "predicted": self.predicted,
+                "misses": self.misses,
+            }
+
+
+_platform_cache = None
+
+
+def configure_platform_cache(path=PLATFORM_CACHE_FILE, max_age_days=PLATFORM_CACHE_MAX_AGE_DAYS):
+    """Install the learned platform cache, loading it from `path` if given."""
+    global _platform_cache
+    _platform_cache = PlatformCache(path, max_age_days)
+    return _platform_cache
+
+
+def get_platform_cache():
+    if _platform_cache is None:
+        configure_platform_cache()
+    return _platform_cache
+
+# --- Stage Timing ---
+
+class StageMetrics:
+    """
+    In-process timing of the update stages (fetch, decode, process, write).
+    Keeps a bounded window of samples per stage for percentiles, the latest
+    timings per route and a summary of each cycle.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}  # stage -> deque of seconds
+        self._counts = {}  # stage -> (count, total seconds), over the process lifetime
+        self._routes = {}  # route -> {stage: seconds}
+        self._cycle = None
+        self.cycles = 0
+        self.last_cycle = None
+
+    @contextmanager
+    def timed(self, stage, route=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, route)
+
+    def record(self, stage, seconds, route=None):
+        if stage == "cycle":
+            cycle_duration.observe(seconds)
+        else:
+            stage_duration.observe(seconds, stage=stage)
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            count, total = self._counts.get(stage, (0, 0.0))
+            self._counts[stage] = (count + 1, total + seconds)
+            if route is not None:
+                self._routes.setdefault(route, {})[stage] = round(seconds, 4)
+            if self._cycle is not None:
+                self._cycle["stages"][stage] = self._cycle["stages"].get(stage, 0.0) + seconds
+
+    def start_cycle(self):
+        with self._lock:
+            self._cycle = {"started_at": datetime.now().isoformat(timespec="seconds"),
+                           "start": time.perf_counter(), "stages": {}}
+
+    def end_cycle(self, routes, failed):
+        with self._lock:
+            cycle, self._cycle = self._cycle, None
+            if cycle is None:
+                return None
+            duration = time.perf_counter() - cycle.pop("start")
+            cycle.update(duration=round(duration, 4), routes=routes, failed=failed)
+            cycle["stages"] = {stage: round(total, 4) for stage, total in cycle["stages"].items()}
+            self.cycles += 1
+            self.last_cycle = cycle
+        self.record("cycle", duration)
+        return cycle
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self):
+        """Per-stage count, total, mean and p50/p90/p99/max (percentiles over the recent window)."""
+        with self._lock:
+            stages = {}
+            for stage, samples in self._samples.items():
+                ordered = sorted(samples)
+                count, total = self._counts[stage]
+                stages[stage] = {
+                    "count": count,
+                    "total": round(total, 4),
+                    "mean": round(total / count, 4),
+                    "p50": round(self._percentile(ordered, 50), 4),
+                    "p90": round(self._percentile(ordered, 90), 4),
+                    "p99": round(self._percentile(ordered, 99), 4),
+                    "max": round(ordered[-1], 4),
+                }
+            return {
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "cycles": self.cycles,
+                "last_cycle": self.last_cycle,
+                "stages": stages,
+                "routes": {route: dict(timings) for route, timings in self._routes.items()},
+            }
+
+
+# --- Prometheus Metrics ---
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in labels) + "}"
+
+
+class PromCounter:
+    """Monotonic counter with optional labels."""
+    type = "counter"
+
+    def __init__(self, name, help_text, value_fn=None):
+        self.name = name
+        self.help = help_text
+        self.value_fn = value_fn  # Read the value at scrape time instead of counting
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self.value_fn is not None:
+            return [(self.name, (), self.value_fn())]
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class PromGauge(PromCounter):
+    """Point-in-time value, normally read from `value_fn` at scrape time."""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class PromHistogram:
+    """Cumulative-bucket histogram with optional labels."""
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = sorted(buckets)
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    out.append((f"{self.name}_bucket", key + (("le", f"{bound:g}"),), count))
+                out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), series[-2]))
+                out.append((f"{self.name}_count", key, series[-2]))
+                out.append((f"{self.name}_sum", key, round(series[-1], 6)))
+        return out
+
+
+class MetricsRegistry:
+    """Holds the exported metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CYCLE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+prometheus = MetricsRegistry()
+api_latency = prometheus.register(PromHistogram(
+    "tfl_api_request_duration_seconds", "Latency of individual TFL API requests.", LATENCY_BUCKETS))
+api_requests = prometheus.register(PromCounter(
+    "tfl_api_requests_total", "TFL API requests by endpoint and HTTP status or failure class."))
+stage_duration = prometheus.register(PromHistogram(
+    "tfl_update_stage_duration_seconds", "Duration of fetch, decode, process and write stages.", LATENCY_BUCKETS))
+cycle_duration = prometheus.register(PromHistogram(
+    "tfl_update_cycle_duration_seconds", "Duration of complete update cycles.", CYCLE_BUCKETS))
+routes_failed = prometheus.register(PromGauge(
+    "tfl_update_routes_failed", "Routes that could not be refreshed in the last cycle."))
+journeys_processed = prometheus.register(PromCounter(
+    "tfl_journeys_processed_total", "Journeys accepted and published."))
+journeys_dropped = prometheus.register(PromCounter(
+    "tfl_journeys_dropped_total", "Journeys discarded during processing, by reason."))
+output_writes = prometheus.register(PromCounter(
+    "tfl_output_writes_total", "Output file updates, by result (written or unchanged)."))
+for _name, _help, _key in (
+    ("tfl_cache_hits_total", "Response cache hits (memory and disk).", lambda s: s["hits"] + s["disk_hits"]),
+    ("tfl_cache_misses_total", "Response cache misses.", lambda s: s["misses"]),
+    ("tfl_cache_evictions_total", "Response cache LRU evictions.", lambda s: s["evictions"]),
+):
+    prometheus.register(PromCounter(_name, _help, value_fn=lambda key=_key: key(get_response_cache().stats())))
+prometheus.register(PromGauge("tfl_cache_hit_ratio", "Share of cache lookups served from the cache.",
+                              value_fn=lambda: get_response_cache().stats()["hit_ratio"]))
+prometheus.register(PromGauge("tfl_cache_bytes", "Raw response bytes held in the in-memory cache.",
+                              value_fn=lambda: get_response_cache().stats()["bytes"]))
+prometheus.register(PromCounter("tfl_platforms_predicted_total", "TBC platforms filled from the learned platform cache.",
+                                value_fn=lambda: get_platform_cache().stats()["predicted"]))
+prometheus.register(PromGauge("tfl_platform_cache_services", "Services with a learned platform.",
+                              value_fn=lambda: get_platform_cache().stats()["services"]))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics from a background thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[{datetime.now().isoformat()}] Metrics endpoint on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+metrics = StageMetrics()
+_metrics_file = METRICS_FILE
+
+
+def configure_metrics_file(path):
+    """Set where write_metrics() output goes after each cycle (empty disables it)."""
+    global _metrics_file
+    _metrics_file = path
 
 # --- Utility Functions ---
 
-def get_journey_plan(origin, destination):
-    """Fetch journey plans from TFL Journey Planner API and log the full response."""
-    url = f"{TFL_BASE_URL}/Journey/JourneyResults/{origin}/to/{destination}"
+def journey_request(origin, destination):
+    """Path and query parameters of a Journey Planner request."""
+    path = f"Journey/JourneyResults/{origin}/to/{destination}"
     
     params = {
         "mode": "overground,national-rail",
@@ -28,69 +1349,220 @@ def get_journey_plan(origin, destination):
         "journeyPreference": "LeastTime",
         "alternativeRoute": "true"
     }
+    return path, params
+
+
+def get_journey_plan(origin, destination, route_name=None):
+    """Fetch journey plans from TFL Journey Planner API, archiving the raw response if enabled."""
+    path, params = journey_request(origin, destination)
     
-    if TFL_APP_ID and TFL_APP_KEY:
-        params["app_id"] = TFL_APP_ID
-        params["app_key"] = TFL_APP_KEY
+    cache = get_response_cache()
+    cache_key = cache.make_key(path, params)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print(f"[{datetime.now().isoformat()}] Using cached journeys from {origin} to {destination}")
+        return cached
     
     try:
         print(f"[{datetime.now().isoformat()}] Fetching journeys from {origin} to {destination}...")
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        with metrics.timed("fetch", route_name):
+            response = tfl_get(path, params)
         
-        json_data = response.json()
+        with metrics.timed("decode", route_name):
+            json_data = json_loads(response.content)
+        cache.put(cache_key, json_data, response.content)
         
-        # --- VERBOSE LOGGING ---
-        print("\n" + "="*80)
-        print(">>> START TFL RAW JSON RESPONSE <<<")
-        print(json.dumps(json_data, indent=2))
-        print(">>> END TFL RAW JSON RESPONSE <<<")
-        print("="*80 + "\n")
-        # --- END VERBOSE LOGGING ---
+        if _archive is not None:
+            try:
+                _archive.append(origin, destination, response.content)
+            except OSError as e:
+                print(f"WARNING: Could not archive TFL response: {e}")
         
         return json_data
         
     except requests.exceptions.RequestException as e:
         print(f"ERROR: Failed to fetch TFL data: {e}")
         return None
+    except ValueError as e:
+        # e.g. an HTML maintenance page served with a 200
+        print(f"ERROR: TFL returned invalid JSON: {e}")
+        return None
+
+
+def iter_json_array(chunks, key="journeys"):
+    """
+    Yield the elements of the array under `key` in a JSON object arriving as byte
+    chunks, each decoded as soon as it is complete. Nothing after the array is
+    read. The first '"key": [' in the text is taken as the array, which holds for
+    JourneyResults where "journeys" precedes any nested data.
+    Raises ValueError if the array is missing or the body ends mid-array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = iter(chunks)
+    buf = ""
+    pos = None  # Offset of the next element in buf, once the array has been found
+    need = 0  # Undecoded characters to wait for before retrying an incomplete element
+    eof = False
+    while True:
+        if pos is None:
+            match = start.search(buf)
+            if match:
+                pos = match.end()
+        if pos is not None:
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos == len(buf) or (len(buf) - pos < need and not eof):
+                    break
+                if buf[pos] == "]":
+                    return
+                try:
+                    item, pos = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise
+                    # Element still incomplete; retrying only after the pending text
+                    # doubles keeps large elements from being re-parsed every chunk
+                    need = 2 * (len(buf) - pos)
+                    break
+                need = 0
+                yield item
+            buf, pos = buf[pos:], 0
+        if eof:
+            raise ValueError(f"Response ended before the end of the '{key}' array")
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buf += utf8.decode(b"", final=True)
+        else:
+            buf += utf8.decode(chunk)
+
+
+def stream_journey_plan(origin, destination, route_name=None):
+    """
+    Request a journey plan and return a generator of its journeys that decodes the
+    body as it downloads. Closing the generator early (once enough journeys are
+    kept) closes the connection, so the rest of the body is never transferred or
+    decoded. Cached responses are replayed from the cache; streamed responses are
+    not cached or archived, since they are usually abandoned part-way.
+    """
+    path, params = journey_request(origin, destination)
+    cache = get_response_cache()
+    cached = cache.get(cache.make_key(path, params))
+    if cached is not None:
+        print(f"[{datetime.now().isoformat()}] Using cached journeys from {origin} to {destination}")
+        return (journey for journey in cached.get('journeys', []))
+
+    try:
+        print(f"[{datetime.now().isoformat()}] Streaming journeys from {origin} to {destination}...")
+        with metrics.timed("fetch", route_name):
+            response = tfl_get(path, params, stream=True)
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: Failed to fetch TFL data: {e}")
+        return (journey for journey in ())
+    return _stream_journeys(response)
+
+
+def _stream_journeys(response):
+    received = 0
+    yielded = 0
+    finished = False
+
+    def _counted(chunks):
+        nonlocal received
+        for chunk in chunks:
+            received += len(chunk)
+            yield chunk
+
+    try:
+        for journey in iter_json_array(_counted(response.iter_content(STREAM_CHUNK_BYTES))):
+            yielded += 1
+            yield journey
+        finished = True
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: TFL response interrupted after {yielded} journeys: {e}")
+    except ValueError as e:
+        print(f"ERROR: Could not decode TFL response: {e}")
+    finally:
+        response.close()
+        if not finished:
+            print(f"Stopped reading the response after {yielded} journeys ({received / 1024:.0f} KiB received)")
+
+
+def _format_hh_mm(dt):
+    # Not memoised: aware datetimes in different offsets compare (and hash) equal
+    return f"{dt.hour:02d}:{dt.minute:02d}"
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_timestamp(dt_string):
+    """
+    Parse a TFL timestamp into (datetime, "HH:MM"), memoised.
+    TFL's fixed 'YYYY-MM-DDTHH:MM:SS' form skips the 'Z' rewrite and takes HH:MM
+    straight from the string; any other form goes through the general path.
+    """
+    try:
+        if len(dt_string) == 19 and dt_string[10] == 'T':
+            return datetime.fromisoformat(dt_string), dt_string[11:16]
+        dt = datetime.fromisoformat(dt_string.replace('Z', '+00:00'))
+    except ValueError:
+        return None, "N/A"
+    return dt, _format_hh_mm(dt)
+
+
+def parse_datetime_hh_mm(dt_string):
+    """Parse a TFL datetime string into (datetime, "HH:MM"), or (None, "N/A") if it is missing or invalid."""
+    if not isinstance(dt_string, str):
+        return None, "N/A"
+    return parse_timestamp(dt_string)
 
 
 def parse_datetime(dt_string):
     """Parse TFL datetime string."""
-    try:
-        return datetime.fromisoformat(dt_string.replace('Z', '+00:00'))
-    except (ValueError, AttributeError):
-        return None
+    return parse_datetime_hh_mm(dt_string)[0]
 
 
 def format_time(dt):
     """Format datetime to HH:MM."""
     if dt:
-        return dt.strftime("%H:%M")
+        return _format_hh_mm(dt)
     return "N/A"
 
 
+# Matches at a lower-cased "pl": "platform 1a", "platforms 3 and 4", "platforms 3-4",
+# "plat. 12", "pl 2/3", "platform no. 5", "platform b". The abbreviations need a "." or
+# a space ("plc", "ply 3" are not platforms), and a lettered platform only pairs with
+# another letter, so "platform 2 or a later train" is just "2". The leading word
+# boundary is checked by the caller.
+_PLATFORM_SEP = r"(?:\s*(?:and|&|or|/|,)\s*|-)"
+_PLATFORM_RE = re.compile(
+    r"pl(?:atforms?\s*|(?:at)?(?:\.\s*|\s+))(?:no\.?\s*)?"
+    r"(?:(\d{1,2}[a-z]?)\b(?:" + _PLATFORM_SEP + r"(\d{1,2}[a-z]?)\b)?"
+    r"|([a-z])\b(?:" + _PLATFORM_SEP + r"([a-z])\b)?)"
+)
+
+
 def extract_platform_from_instruction(instruction_text):
-    """Try to extract platform from instruction text (LAST RESORT fallback)."""
+    """
+    Try to extract platform from instruction text (LAST RESORT fallback).
+    Alternatives such as "platforms 3 and 4" are returned as "3/4".
+    """
     if not instruction_text:
         return None
-    
+
     text_lower = instruction_text.lower()
-    
-    # Look for "platform X" pattern
-    if 'platform' in text_lower:
-        parts = text_lower.split('platform')
-        if len(parts) > 1:
-            after = parts[1].strip()
-            platform = ''
-            for char in after:
-                # Allows for digits and single letters (e.g., Platform 1a)
-                if char.isdigit() or (char.isalpha() and len(platform) == 1):
-                    platform += char
-                elif platform:
-                    break
-            if platform:
-                return platform.upper()
+    # Only try the pattern where a word starts with "pl"; most instructions have none
+    idx = text_lower.find('pl')
+    while idx != -1:
+        if idx == 0 or not text_lower[idx - 1].isalnum():
+            match = _PLATFORM_RE.match(text_lower, idx)
+            if match:
+                first = match.group(1) or match.group(3)
+                second = match.group(2) or match.group(4)
+                return f"{first}/{second}".upper() if second else first.upper()
+        idx = text_lower.find('pl', idx + 2)
     return None
 
 
@@ -132,183 +1604,974 @@ def get_platform_from_leg(leg, is_departure=False):
     platform_from_text = extract_platform_from_instruction(instruction_text)
     if platform_from_text:
         return platform_from_text
-        
+
     return None
 
-# --- New/Modified Core Logic ---
 
-def process_journey(journey, journey_id):
-    """Process a TFL journey for direct or two-train routes."""
-    start_time = parse_datetime(journey.get('startDateTime'))
-    arrival_time = parse_datetime(journey.get('arrivalDateTime'))
-    duration_mins = journey.get('duration', 0)
-    
-    legs = journey.get('legs', [])
-    
-    # Filter for only rail legs (National Rail or Overground)
-    rail_legs = [
-        leg for leg in legs 
-        if leg.get('mode', {}).get('name', '') in ['national-rail', 'overground']
-    ]
-    
-    if not rail_legs:
-        return None
-    
-    # Check for multi-modal (non-train/non-walk) legs which should be excluded
-    allowed_modes = ['walking', 'walk', 'national-rail', 'overground']
-    if any(leg.get('mode', {}).get('name', '') not in allowed_modes for leg in legs):
-        return None
+def resolve_platform(leg, is_departure=False, cache=None):
+    """
+    Platform to show for a leg as (platform, predicted). Announced platforms are
+    recorded in `cache` (a PlatformCache); while TFL says "TBC" the platform last
+    used by the same service is returned with predicted=True. Without a cache
+    nothing is learned or predicted, so the result depends only on the leg.
+    """
+    platform = get_platform_from_leg(leg, is_departure)
+    if cache is None:
+        return platform or "TBC", False
+    key = cache.make_key(leg, is_departure)
+    if key is None:
+        return platform or "TBC", False
+    if platform:
+        cache.record(key, platform)
+        return platform, False
+    predicted = cache.predict(key)
+    if predicted:
+        return predicted, True
+    return "TBC", False
 
-    # --- REVISED STATUS LOGIC: Focus ONLY on Timing Delays ---
-    status = "On Time"
-    
-    # Check if any leg has an explicitly reported arrival delay greater than 60 seconds (1 minute).
-    # This filters out minor fluctuations and general station advisories.
-    has_explicit_delay = any(
-        leg.get('arrivalPoint', {}).get('timing', {}).get('arrivalDelay', 0) > 60 
-        for leg in legs
-    )
-    
-    if has_explicit_delay:
-        status = "Delayed" 
-    # --- END REVISED STATUS LOGIC ---
-            
-    processed_legs = []
-    transfer_mins = 0
-
-    # --- Direct Train (1 rail leg) ---
-    if len(rail_legs) == 1:
-        leg1 = rail_legs[0]
-        leg1_depart = parse_datetime(leg1.get('departureTime'))
-        leg1_arrive = parse_datetime(leg1.get('arrivalTime'))
-        leg1_route = leg1.get('routeOptions', [])
-        leg1_line = leg1_route[0].get('name', 'Rail') if leg1_route else 'Rail'
-        
-        # Departure platform (at Streatham Common)
-        leg1_platform = get_platform_from_leg(leg1, is_departure=True)
-        
-        processed_legs.append({
-            "origin": "Streatham Common",
-            "destination": "Imperial Wharf",
-            "departure": format_time(leg1_depart),
-            "arrival": format_time(leg1_arrive),
-            "departurePlatform": leg1_platform or "TBC",
-            "operator": leg1_line,
-            "status": status
-        })
+# --- Journey Model ---
+# Processed journeys are held as slotted objects and only turned into the
+# dashboard's JSON shape (see Journey.to_dict) when they are written out.
 
-    # --- Two-Train Journey (2 rail legs) ---
-    elif len(rail_legs) == 2:
-        
-        # Leg 1: Streatham Common to Interchange (e.g. Clapham Junction)
-        leg1 = rail_legs[0]
-        leg1_depart = parse_datetime(leg1.get('departureTime'))
-        leg1_arrive = parse_datetime(leg1.get('arrivalTime'))
-        leg1_route = leg1.get('routeOptions', [])
-        leg1_line = leg1_route[0].get('name', 'Rail') if leg1_route else 'Rail'
-
-        # Leg 2: Interchange to Imperial Wharf
-        leg2 = rail_legs[1]
-        leg2_depart = parse_datetime(leg2.get('departureTime'))
-        leg2_arrive = parse_datetime(leg2.get('arrivalTime'))
-        leg2_route = leg2.get('routeOptions', [])
-        leg2_line = leg2_route[0].get('name', 'Rail') if leg2_route else 'Rail'
-
-        # Interchange Station (e.g., Clapham Junction)
-        interchange = leg1.get('arrivalPoint', {}).get('commonName', 'Interchange')
-
-        # Platform Extraction at Interchange
-        leg1_arrival_platform = get_platform_from_leg(leg1, is_departure=False)
-        leg2_departure_platform = get_platform_from_leg(leg2, is_departure=True)
-
-        # Calculate transfer time
-        if leg1_arrive and leg2_depart:
-            transfer_mins = int((leg2_depart - leg1_arrive).total_seconds() / 60)
-        
-        # First Train Leg
-        processed_legs.append({
-            "origin": "Streatham Common",
-            "destination": interchange,
-            "departure": format_time(leg1_depart),
-            "arrival": format_time(leg1_arrive),
-            "arrivalPlatform_ClaphamJunction": leg1_arrival_platform or "TBC",
-            "operator": leg1_line,
-            "status": status
-        })
-        
-        # Transfer Detail
-        processed_legs.append({
+@dataclass(slots=True)
+class Leg:
+    """A rail leg, parsed once from a TFL leg."""
+    origin: str
+    destination: str
+    departure: datetime | None
+    arrival: datetime | None
+    operator: str
+    departure_platform: str | None = None
+    departure_predicted: bool = False
+    arrival_platform: str | None = None
+    arrival_predicted: bool = False
+    departure_time: str = "N/A"  # HH:MM as parsed, so output needs no formatting
+    arrival_time: str = "N/A"
+
+    @classmethod
+    def from_tfl(cls, leg, departure_platform=False, arrival_platform=False, platform_cache=None):
+        """Build a Leg from a raw TFL leg, resolving only the platforms asked for."""
+        route_options = leg.get('routeOptions', [])
+        departure, departure_time = parse_datetime_hh_mm(leg.get('departureTime'))
+        arrival, arrival_time = parse_datetime_hh_mm(leg.get('arrivalTime'))
+        parsed = cls(
+            origin=leg.get('departurePoint', {}).get('commonName', 'Unknown'),
+            destination=leg.get('arrivalPoint', {}).get('commonName', 'Interchange'),
+            departure=departure,
+            arrival=arrival,
+            operator=route_options[0].get('name', 'Rail') if route_options else 'Rail',
+            departure_time=departure_time,
+            arrival_time=arrival_time,
+        )
+        if departure_platform:
+            parsed.departure_platform, parsed.departure_predicted = resolve_platform(leg, True, platform_cache)
+        if arrival_platform:
+            parsed.arrival_platform, parsed.arrival_predicted = resolve_platform(leg, False, platform_cache)
+        return parsed
+
+    def to_dict(self, status, platform_key=None, departure_side=True):
+        """Output form of the leg, showing one platform under `platform_key` if given."""
+        out = {
+            "origin": self.origin,
+            "destination": self.destination,
+            "departure": self.departure_time,
+            "arrival": self.arrival_time,
+        }
+        if platform_key:
+            if departure_side:
+                platform, predicted = self.departure_platform, self.departure_predicted
+            else:
+                platform, predicted = self.arrival_platform, self.arrival_predicted
+            out[platform_key] = platform or "TBC"
+        out["operator"] = self.operator
+        out["status"] = status
+        if platform_key and predicted:
+            out["platformPredicted"] = True
+        return out
+
+
+@dataclass(slots=True)
+class Transfer:
+    """A change of trains between two rail legs, with the platforms on either side."""
+    location: str
+    minutes: int
+    arrival_platform: str | None
+    arrival_predicted: bool
+    departure_platform: str | None
+    departure_predicted: bool
+
+    @classmethod
+    def between(cls, incoming, outgoing):
+        """The interchange from the `incoming` rail leg to the `outgoing` one."""
+        minutes = 0
+        if incoming.arrival and outgoing.departure:
+            minutes = int((outgoing.departure - incoming.arrival).total_seconds() / 60)
+        return cls(incoming.destination, minutes,
+                   incoming.arrival_platform, incoming.arrival_predicted,
+                   outgoing.departure_platform, outgoing.departure_predicted)
+
+    def to_dict(self):
+        out = {
             "type": "transfer",
-            "location": interchange,
-            "transferTime": f"{transfer_mins} min"
-        })
-        
-        # Second Train Leg
-        processed_legs.append({
-            "origin": interchange,
-            "destination": "Imperial Wharf",
-            "departure": format_time(leg2_depart),
-            "arrival": format_time(leg2_arrive),
-            "departurePlatform_ClaphamJunction": leg2_departure_platform or "TBC",
-            "operator": leg2_line,
-            "status": status
-        })
+            "location": self.location,
+            "transferTime": f"{self.minutes} min",
+            "arrivalPlatform": self.arrival_platform or "TBC",
+            "departurePlatform": self.departure_platform or "TBC",
+        }
+        if self.arrival_predicted:
+            out["arrivalPlatformPredicted"] = True
+        if self.departure_predicted:
+            out["departurePlatformPredicted"] = True
+        return out
 
-    else:
-        # Exclude journeys with 0, 3, or more rail legs
+
+@dataclass(slots=True)
+class Journey:
+    """A processed journey: rail legs with the transfers between them."""
+    id: int
+    departure: datetime | None
+    arrival: datetime | None
+    duration: int
+    status: str
+    updated_at: str
+    legs: list
+    transfers: list
+    departure_time: str = "N/A"  # HH:MM as parsed
+    arrival_time: str = "N/A"
+
+    @property
+    def type(self):
+        changes = len(self.transfers)
+        if changes == 0:
+            return "Direct"
+        return "One Change" if changes == 1 else f"{changes} Changes"
+
+    def to_dict(self):
+        """
+        The journey in the JSON shape index.html reads: rail legs alternating with
+        transfers, which carry the interchange platforms. Direct journeys show the
+        departure platform on the leg; one-change journeys also keep the original
+        *_ClaphamJunction platform keys on their legs for older dashboards.
+        """
+        if len(self.legs) == 1:
+            legs = [self.legs[0].to_dict(self.status, "departurePlatform", departure_side=True)]
+        elif len(self.legs) == 2:
+            first, second = self.legs
+            legs = [
+                first.to_dict(self.status, "arrivalPlatform_ClaphamJunction", departure_side=False),
+                self.transfers[0].to_dict(),
+                second.to_dict(self.status, "departurePlatform_ClaphamJunction", departure_side=True),
+            ]
+        else:
+            legs = [self.legs[0].to_dict(self.status)]
+            for transfer, leg in zip(self.transfers, self.legs[1:]):
+                legs.append(transfer.to_dict())
+                legs.append(leg.to_dict(self.status))
+        return {
+            "id": self.id,
+            "type": self.type,
+            "departureTime": self.departure_time,
+            "arrivalTime": self.arrival_time,
+            "totalDuration": f"{self.duration} min",
+            "status": self.status,
+            "live_updated_at": self.updated_at,
+            "legs": legs,
+        }
+
+# --- New/Modified Core Logic ---
+
+def station_label(station_name):
+    """Short display name for a station, e.g. 'Streatham Common Rail Station' -> 'Streatham Common'."""
+    return station_name.replace(" Rail Station", "")
+
+
+RAIL_MODES = frozenset(('national-rail', 'overground'))
+ALLOWED_MODES = RAIL_MODES | {'walking', 'walk'}
+DELAY_THRESHOLD_SECONDS = 60  # Smaller arrival delays are fluctuations, not "Delayed"
+
+
+def scan_legs(legs, max_rail_legs=MAX_RAIL_LEGS):
+    """
+    Classify a journey's legs in a single pass. Returns (rail_legs, delayed, reason):
+    the National Rail/Overground legs in order, whether any leg reports an arrival
+    delay over DELAY_THRESHOLD_SECONDS, and None or the reason code the journey is
+    dropped for. The scan stops at the first leg that rules the journey out
+    ("non_rail_leg" for modes other than rail or walking, "too_many_rail_legs" past
+    max_rail_legs when that is non-zero); "no_rail_leg" is reported at the end.
+    """
+    rail_legs = []
+    delayed = False
+    for leg in legs:
+        mode = leg.get('mode', {}).get('name', '')
+        if mode in RAIL_MODES:
+            rail_legs.append(leg)
+            if max_rail_legs and len(rail_legs) > max_rail_legs:
+                return rail_legs, delayed, "too_many_rail_legs"
+        elif mode not in ALLOWED_MODES:
+            return rail_legs, delayed, "non_rail_leg"
+        # Only explicit arrival delays count; general station advisories are ignored
+        if not delayed and leg.get('arrivalPoint', {}).get('timing', {}).get('arrivalDelay', 0) > DELAY_THRESHOLD_SECONDS:
+            delayed = True
+    if not rail_legs:
+        return rail_legs, delayed, "no_rail_leg"
+    return rail_legs, delayed, None
+
+
+def process_journey(journey, journey_id, origin_label=station_label(ORIGIN),
+                    destination_label=station_label(DESTINATION), platform_cache=None):
+    """
+    Process a TFL journey with any number of train legs into a Journey (None if
+    unsuitable). Direct journeys get the departure platform at the origin; journeys
+    with changes get the arrival and departure platforms at every interchange.
+    Platforms are learned and predicted only when a platform_cache is given.
+    """
+    rail_legs, delayed, reason = scan_legs(journey.get('legs', []))
+    if reason:
+        journeys_dropped.inc(reason=reason)
         return None
+    status = "Delayed" if delayed else "On Time"
 
-    return {
-        "id": journey_id,
-        "type": "Direct" if len(rail_legs) == 1 else "One Change",
-        "departureTime": format_time(start_time),
-        "arrivalTime": format_time(arrival_time),
-        "totalDuration": f"{duration_mins} min",
-        "status": status,
-        "live_updated_at": datetime.now().strftime("%H:%M:%S"),
-        "legs": processed_legs
-    }
+    last = len(rail_legs) - 1
+    parsed_legs = [
+        Leg.from_tfl(leg, departure_platform=idx > 0 or last == 0, arrival_platform=idx < last,
+                     platform_cache=platform_cache)
+        for idx, leg in enumerate(rail_legs)
+    ]
+    transfers = [Transfer.between(incoming, outgoing) for incoming, outgoing in zip(parsed_legs, parsed_legs[1:])]
 
+    parsed_legs[0].origin = origin_label
+    parsed_legs[-1].destination = destination_label
 
-def fetch_and_process_tfl_data(num_journeys):
-    """Fetch and process TFL journey data for a fixed number of valid train journeys."""
-    
-    journey_data = get_journey_plan(ORIGIN, DESTINATION)
-    
+    departure, departure_time = parse_datetime_hh_mm(journey.get('startDateTime'))
+    arrival, arrival_time = parse_datetime_hh_mm(journey.get('arrivalDateTime'))
+    return Journey(
+        id=journey_id,
+        departure=departure,
+        arrival=arrival,
+        duration=journey.get('duration', 0),
+        status=status,
+        updated_at=datetime.now().strftime("%H:%M:%S"),
+        legs=parsed_legs,
+        transfers=transfers,
+        departure_time=departure_time,
+        arrival_time=arrival_time,
+    )
+
+
+def process_journey_data(journey_data, num_journeys, origin=ORIGIN, destination=DESTINATION, verbose=True,
+                         platform_cache=None):
+    """
+    Turn a raw JourneyResults response into up to num_journeys valid train journeys
+    (Journey objects). With verbose=False only errors are printed (used by replay).
+    Live fetches pass the shared platform cache; replay and benchmarks leave it out
+    so their output does not depend on what was processed before.
+    """
     if not journey_data or 'journeys' not in journey_data:
         print("ERROR: No journey data received from TFL API")
         return []
     
     journeys = journey_data.get('journeys', [])
-    print(f"Found {len(journeys)} total journeys from TFL in the response.")
-    
+    if verbose:
+        print(f"Found {len(journeys)} total journeys from TFL in the response.")
+    return process_journeys(journeys, num_journeys, origin, destination, verbose, platform_cache)
+
+
+def process_journeys(journeys, num_journeys, origin=ORIGIN, destination=DESTINATION, verbose=True,
+                     platform_cache=None):
+    """
+    Process TFL journeys in order until num_journeys valid ones are kept. `journeys`
+    may be any iterable, such as stream_journey_plan() while the response downloads;
+    nothing past the last journey needed is pulled from it.
+    """
+    origin_label = station_label(origin)
+    destination_label = station_label(destination)
     processed = []
     for idx, journey in enumerate(journeys, 1):
         try:
-            processed_journey = process_journey(journey, len(processed) + 1)
+            processed_journey = process_journey(
+                journey, len(processed) + 1,
+                origin_label=origin_label,
+                destination_label=destination_label,
+                platform_cache=platform_cache,
+            )
             if processed_journey:
                 processed.append(processed_journey)
-                print(f"✓ Journey {len(processed)} ({processed_journey['type']}): {processed_journey['departureTime']} → {processed_journey['arrivalTime']} | Status: {processed_journey['status']}")
+                journeys_processed.inc()
+                if verbose:
+                    print(f"✓ Journey {len(processed)} ({processed_journey.type}): {processed_journey.departure_time} → {processed_journey.arrival_time} | Status: {processed_journey.status}")
                 
                 if len(processed) >= num_journeys:
                     break
         except Exception as e:
             print(f"ERROR processing journey {idx}: {e}")
+            journeys_dropped.inc(reason="error")
             continue
     
-    print(f"Successfully processed {len(processed)} train journeys (Direct or One Change)")
+    if verbose:
+        print(f"Successfully processed {len(processed)} train journeys")
     return processed
 
 
-def main():
-    data = fetch_and_process_tfl_data(NUM_JOURNEYS)
-    
-    if data:
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
-        print(f"\n✓ Successfully saved {len(data)} journeys to {OUTPUT_FILE}")
+def fetch_and_process_tfl_data(num_journeys, origin=ORIGIN, destination=DESTINATION, route_name=None):
+    """Fetch and process TFL journey data for a fixed number of valid train journeys."""
+    if _streaming:
+        journeys = stream_journey_plan(origin, destination, route_name)
+        try:
+            # The body is decoded as journeys are pulled, so decoding is timed as processing
+            with metrics.timed("process", route_name):
+                return process_journeys(journeys, num_journeys, origin, destination,
+                                        platform_cache=get_platform_cache())
+        finally:
+            journeys.close()
+
+    journey_data = get_journey_plan(origin, destination, route_name)
+    with metrics.timed("process", route_name):
+        return process_journey_data(journey_data, num_journeys, origin, destination,
+                                    platform_cache=get_platform_cache())
+
+
+_streaming = TFL_STREAM
+
+
+def configure_streaming(enabled=TFL_STREAM):
+    """Switch between streamed and whole-body decoding of journey responses."""
+    global _streaming
+    _streaming = enabled
+
+
+# --- Routes & Batch Refresh ---
+
+def default_routes():
+    """The single built-in route, written to OUTPUT_FILE for the dashboard."""
+    return [{
+        "name": "default",
+        "origin": ORIGIN,
+        "destination": DESTINATION,
+        "journeys": NUM_JOURNEYS,
+        "output": OUTPUT_FILE,
+    }]
+
+
+def _route_slug(text):
+    slug = "".join(c if c.isalnum() else "_" for c in station_label(text).lower())
+    return "_".join(part for part in slug.split("_") if part)
+
+
+def load_routes(path):
+    """
+    Load routes from a JSON or TOML file. The file holds either a list of routes or
+    an object with a "routes" list. Each route needs "origin" and "destination";
+    "name", "journeys" and "output" are optional.
+    """
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"Reading {path} requires Python 3.11+ (tomllib)")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+
+    entries = data.get("routes", []) if isinstance(data, dict) else data
+    if not entries:
+        raise ValueError(f"No routes defined in {path}")
+
+    routes = []
+    seen_names, seen_outputs = set(), set()
+    for idx, entry in enumerate(entries, 1):
+        if not entry.get("origin") or not entry.get("destination"):
+            raise ValueError(f"Route {idx} in {path} must define 'origin' and 'destination'")
+
+        name = entry.get("name") or f"{_route_slug(entry['origin'])}_to_{_route_slug(entry['destination'])}"
+        output = entry.get("output") or f"live_data_{name}.json"
+        journeys = int(entry.get("journeys", NUM_JOURNEYS))
+        if journeys < 1:
+            raise ValueError(f"Route '{name}' must request at least one journey")
+        if name in seen_names or output in seen_outputs:
+            raise ValueError(f"Duplicate route name or output file for route '{name}'")
+        seen_names.add(name)
+        seen_outputs.add(output)
+
+        routes.append({
+            "name": name,
+            "origin": entry["origin"],
+            "destination": entry["destination"],
+            "journeys": journeys,
+            "output": output,
+        })
+    return routes
+
+
+_output_hashes = {}  # output path -> (content_hash(), output mode) of what the file holds
+_output_mode = OUTPUT_MODE
+_manifest_path = OUTPUT_MANIFEST
+_manifest = None  # output path -> manifest entry; loaded on first compact write
+_manifest_dirty = False
+PRECOMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+def configure_output(mode=OUTPUT_MODE, manifest=OUTPUT_MANIFEST):
+    """Choose pretty or compact output, and where compact mode keeps its manifest."""
+    global _output_mode, _manifest_path, _manifest, _manifest_dirty
+    if mode not in ("pretty", "compact"):
+        raise ValueError(f"Unknown output mode '{mode}'")
+    _output_mode = mode
+    _manifest_path = manifest
+    _manifest = None
+    _manifest_dirty = False
+
+
+# Change on every run; ignored when comparing outputs. fetchedAt is deliberately not
+# here: it is the last successful fetch and must reach the file for snapshot ages.
+VOLATILE_FIELDS = ("live_updated_at",)
+
+
+def content_hash(data):
+    """Hash of the journeys ignoring the per-run timestamps in VOLATILE_FIELDS."""
+    semantic = [{k: v for k, v in journey.items() if k not in VOLATILE_FIELDS} for journey in data]
+    return hashlib.sha256(json_dumps(semantic)).hexdigest()
+
+
+def _stored_hash(path):
+    if path not in _output_hashes:
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            # Pretty output starts with "[" and a newline; compact output has no whitespace
+            mode = "pretty" if body[:2] == b"[\n" else "compact"
+            _output_hashes[path] = (content_hash(json_loads(body)), mode)
+        except (OSError, ValueError, AttributeError, TypeError):
+            _output_hashes[path] = None
+    return _output_hashes[path]
+
+
+def _atomic_write(path, body):
+    """Replace `path` with `body` via a temporary file and rename."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def precompress(body):
+    """Pre-compressed variants of an output body by file suffix (.br only with brotli installed)."""
+    variants = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+def write_output(path, data):
+    """
+    Write processed journeys for one route to its output file. The file is replaced
+    atomically (written to a temporary file, then renamed), so readers never see a
+    partial file. When only live_updated_at would change, the file is left as is.
+    In compact mode the JSON is minified and written with .gz/.br siblings for static
+    hosts to serve as-is; in pretty mode leftover siblings are removed so they cannot
+    go stale. Returns True if the file was rewritten.
+    """
+    digest = content_hash(data)
+    if (digest, _output_mode) == _stored_hash(path):
+        output_writes.inc(result="unchanged")
+        print(f"\n✓ No changes for {path}; kept the existing file")
+        return False
+
+    compact = _output_mode == "compact"
+    body = json_dumps(data, pretty=not compact)
+    variants = precompress(body) if compact else {}
+    for suffix in PRECOMPRESSED_SUFFIXES:
+        if suffix in variants:
+            _atomic_write(path + suffix, variants[suffix])
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    _atomic_write(path, body)
+
+    _output_hashes[path] = (digest, _output_mode)
+    if compact:
+        _record_manifest_entry(path, body, variants)
+    output_writes.inc(result="written")
+    print(f"\n✓ Successfully saved {len(data)} journeys to {path} ({len(body)} bytes"
+          + "".join(f", {suffix} {len(v)}" for suffix, v in variants.items()) + ")")
+    return True
+
+
+def _record_manifest_entry(path, body, variants):
+    global _manifest, _manifest_dirty
+    if not _manifest_path:
+        return
+    if _manifest is None:
+        try:
+            with open(_manifest_path, 'rb') as f:
+                _manifest = json_loads(f.read()).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            _manifest = {}
+    entry = {
+        "bytes": len(body),
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    for suffix, compressed in variants.items():
+        entry[suffix.lstrip(".")] = {"path": path + suffix, "bytes": len(compressed)}
+    _manifest[path] = entry
+    _manifest_dirty = True
+
+
+def write_manifest():
+    """
+    Write the compact-mode manifest (per output file: size, SHA-256 of the JSON and
+    the sizes of its pre-compressed siblings) if any output changed this cycle.
+    """
+    global _manifest_dirty
+    if not _manifest_dirty:
+        return
+    manifest = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "files": dict(sorted(_manifest.items())),
+    }
+    _atomic_write(_manifest_path, json_dumps(manifest, pretty=True))
+    _manifest_dirty = False
+
+
+# --- Last Good Snapshots (stale-while-revalidate) ---
+
+_snapshots = {}  # route name -> {"data": [...], "fetched_at": epoch seconds}
+
+
+def _load_snapshot_file(path):
+    """
+    Recover the last published journeys from an output file. Their age comes from the
+    fetchedAt timestamp stored in the file, not its mtime, which a fresh checkout resets.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, list) or not data:
+        return None
+
+    fetched_at = data[0].get("fetchedAt")
+    if not isinstance(fetched_at, (int, float)):
+        return None  # Written before fetchedAt existed; its age is unknown
+    journeys = [{k: v for k, v in j.items() if k != "stale"} for j in data]
+    return {"data": journeys, "fetched_at": fetched_at}
+
+
+def get_last_good_snapshot(route):
+    """Return the route's last successfully fetched journeys (from memory or its output file)."""
+    snapshot = _snapshots.get(route["name"])
+    if snapshot is None:
+        snapshot = _load_snapshot_file(route["output"])
+        if snapshot:
+            _snapshots[route["name"]] = snapshot
+    return snapshot
+
+
+def publish_stale_snapshot(route):
+    """
+    Re-publish the last good journeys marked as stale. Their age is left for readers to
+    work out from fetchedAt, so repeated re-publishes of one snapshot are identical and
+    the file is only written once per outage. Returns True if published.
+    """
+    snapshot = get_last_good_snapshot(route)
+    if not snapshot:
+        return False
+
+    age = max(0, int(time.time() - snapshot["fetched_at"]))
+    stale = [dict(journey, stale=True) for journey in snapshot["data"]]
+    print(f"⚠ Serving last good data for route '{route['name']}' ({age // 60} min old)")
+    with metrics.timed("write", route["name"]):
+        write_output(route["output"], stale)
+    return True
+
+
+def save_route_result(route, journeys):
+    """
+    Write a route's freshly processed journeys. Without fresh data the last good
+    snapshot is re-published marked as stale. Returns True only for fresh data.
+    """
+    if journeys:
+        fetched_at = int(time.time())
+        with metrics.timed("write", route["name"]):
+            data = [dict(journey.to_dict(), fetchedAt=fetched_at) for journey in journeys]
+            write_output(route["output"], data)
+        _snapshots[route["name"]] = {"data": data, "fetched_at": fetched_at}
+        return True
+
+    print(f"\n⚠ No journey data generated for route '{route['name']}'.")
+    publish_stale_snapshot(route)
+    return False
+
+
+def refresh_route(route):
+    """Fetch, process and save a single route. Returns True if fresh data was written."""
+    data = fetch_and_process_tfl_data(route["journeys"], route["origin"], route["destination"], route["name"])
+    return save_route_result(route, data)
+
+
+async def refresh_routes_async(routes, concurrency=FETCH_CONCURRENCY):
+    """
+    Fetch many routes concurrently with at most `concurrency` requests in flight.
+    Requests run on worker threads through the shared session; each response is
+    processed and written on the event loop as soon as it arrives. When streaming,
+    responses are decoded and processed on the worker threads while they download.
+    Returns the routes that could not be refreshed.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fetch(route, executor):
+        journey_data = journeys = None
+        async with semaphore:
+            try:
+                if _streaming:
+                    journeys = await loop.run_in_executor(
+                        executor, fetch_and_process_tfl_data,
+                        route["journeys"], route["origin"], route["destination"], route["name"]
+                    )
+                else:
+                    journey_data = await loop.run_in_executor(
+                        executor, get_journey_plan, route["origin"], route["destination"], route["name"]
+                    )
+            except Exception as e:
+                print(f"ERROR: Route '{route['name']}' fetch failed: {e}")
+        return route, journey_data, journeys
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tfl-fetch") as executor:
+        tasks = [asyncio.create_task(_fetch(route, executor)) for route in routes]
+        for next_done in asyncio.as_completed(tasks):
+            route, journey_data, data = await next_done
+            try:
+                if data is None:
+                    with metrics.timed("process", route["name"]):
+                        data = process_journey_data(journey_data, route["journeys"], route["origin"],
+                                                    route["destination"], platform_cache=get_platform_cache())
+                if not save_route_result(route, data):
+                    failed.append(route)
+            except Exception as e:
+                print(f"ERROR: Route '{route['name']}' failed: {e}")
+                failed.append(route)
+    return failed
+
+
+def run_cycle(routes=None, concurrency=1):
+    """
+    Refresh every route once, sharing the HTTP session. With concurrency > 1 and
+    several routes the async fetcher is used. Returns the routes that could not be
+    refreshed (those are served from their last good snapshot where possible).
+    """
+    routes = routes or default_routes()
+    metrics.start_cycle()
+
+    if concurrency > 1 and len(routes) > 1:
+        # Make sure every in-flight request can get its own pooled socket
+        ensure_pool_size(concurrency)
+        failed = asyncio.run(refresh_routes_async(routes, concurrency))
+    else:
+        failed = []
+        for route in routes:
+            try:
+                if not refresh_route(route):
+                    failed.append(route)
+            except Exception as e:
+                print(f"ERROR: Route '{route['name']}' failed: {e}")
+                failed.append(route)
+
+    if len(routes) > 1:
+        print(f"\n[{datetime.now().isoformat()}] Refreshed {len(routes) - len(failed)}/{len(routes)} routes")
+
+    cache = get_response_cache()
+    if cache.enabled:
+        cache.purge_expired()
+        print(f"Response cache: {cache.stats()}")
+    if _hedger is not None:
+        print(f"Hedged requests: {_hedger.stats()}")
+    try:
+        write_manifest()
+    except OSError as e:
+        print(f"WARNING: Could not write output manifest: {e}")
+    platforms = get_platform_cache()
+    platforms.save()
+    print(f"Learned platforms: {platforms.stats()}")
+
+    cycle = metrics.end_cycle(len(routes), len(failed))
+    routes_failed.set(len(failed))
+    print(f"Stage timings (s): {cycle['stages']}")
+    if _metrics_file:
+        write_metrics(_metrics_file)
+    return failed
+
+
+def write_metrics(path):
+    """Write stage timing aggregates (plus cache/hedging counters) as JSON next to the journey data."""
+    report = metrics.summary()
+    if _response_cache is not None:
+        report["cache"] = _response_cache.stats()
+    if _hedger is not None:
+        report["hedging"] = _hedger.stats()
+    if _platform_cache is not None:
+        report["platforms"] = _platform_cache.stats()
+    with open(path, 'wb') as f:
+        f.write(json_dumps(report, pretty=True))
+
+
+def run_daemon(interval, jitter, routes=None, concurrency=1):
+    """
+    Keep the process alive and re-run the update cycle on a fixed cadence.
+    The interpreter, imports and any HTTP connections are reused between cycles.
+    Jitter is applied to each wait only, so the schedule does not drift.
+    Routes that fail are revalidated between full cycles with exponential backoff
+    (starting at REVALIDATE_MIN_DELAY) while their last good data stays published.
+    """
+    routes = routes or default_routes()
+    stop_event = threading.Event()
+
+    def _request_stop(signum, frame):
+        print(f"[{datetime.now().isoformat()}] Received signal {signum}, stopping after current cycle...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    print(f"[{datetime.now().isoformat()}] Daemon mode: interval={interval}s, jitter=±{jitter}s")
+    next_run = time.monotonic()
+    failed = []
+    retry_at = None
+    backoff = min(REVALIDATE_MIN_DELAY, interval)
+
+    while not stop_event.is_set():
+        full_cycle = retry_at is None or next_run <= retry_at
+        batch = routes if full_cycle else failed
+
+        cycle_start = time.monotonic()
+        try:
+            failed = run_cycle(batch, concurrency)
+        except Exception as e:
+            # Never let a single bad cycle kill the daemon
+            print(f"ERROR: Update cycle failed: {e}")
+            failed = list(batch)
+        label = "Cycle" if full_cycle else "Revalidation"
+        print(f"[{datetime.now().isoformat()}] {label} finished in {time.monotonic() - cycle_start:.2f}s")
+
+        now = time.monotonic()
+        if full_cycle:
+            next_run += interval
+            if next_run < now:
+                # The cycle overran the interval; skip missed slots instead of bursting
+                next_run = now
+
+        if failed:
+            retry_at = now + backoff
+            print(f"Revalidating {len(failed)} route(s) in {backoff:.0f}s")
+            backoff = min(backoff * 2, interval)
+        else:
+            retry_at = None
+            backoff = min(REVALIDATE_MIN_DELAY, interval)
+
+        if retry_at is not None and retry_at < next_run:
+            delay = retry_at - now
+        else:
+            delay = next_run - now + random.uniform(-jitter, jitter)
+        stop_event.wait(max(0.0, delay))
+
+    print(f"[{datetime.now().isoformat()}] Daemon stopped.")
+
+
+# --- Offline Replay ---
+
+def _replay_entries(directory, entries, num_journeys, collect=False):
+    """
+    Decode and process archived responses. Runs in worker processes for parallel replay.
+    stats["journeys"] counts the journeys actually examined: processing stops once
+    num_journeys are kept, so later journeys in a response are never looked at.
+    """
+    archive = ResponseArchive(directory)
+    stats = {"responses": 0, "journeys": 0, "processed": 0, "errors": 0}
+    results = []
+
+    def counted(journeys):
+        for journey in journeys:
+            stats["journeys"] += 1
+            yield journey
+
+    for entry in entries:
+        try:
+            journey_data = json_loads(archive.read(entry))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not read archived response at {entry['segment']}:{entry['offset']}: {e}")
+            stats["errors"] += 1
+            continue
+
+        if isinstance(journey_data, dict) and "journeys" in journey_data:
+            journey_data = dict(journey_data, journeys=counted(journey_data["journeys"] or []))
+        processed = process_journey_data(
+            journey_data, num_journeys, entry["origin"], entry["destination"], verbose=False
+        )
+        stats["responses"] += 1
+        stats["processed"] += len(processed)
+        if collect:
+            results.append({
+                "origin": entry["origin"],
+                "destination": entry["destination"],
+                "fetched_at": entry["fetched_at"],
+                "journeys": [journey.to_dict() for journey in processed],
+            })
+    return stats, results
+
+
+def replay_archive(directory, workers=1, num_journeys=NUM_JOURNEYS, output=None, origin=None, destination=None):
+    """
+    Run archived raw responses through the normal processing pipeline without any
+    network access and report throughput. With `output`, the processed journeys are
+    written as JSON lines (one archived response per line) for backfills.
+    """
+    archive = ResponseArchive(directory)
+    entries = list(archive.entries(origin, destination))
+    if not entries:
+        print(f"No archived responses found in {directory}")
+        return {"responses": 0, "journeys": 0, "processed": 0, "errors": 0}
+
+    collect = output is not None
+    start = time.perf_counter()
+    if workers > 1:
+        chunks = [entries[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_replay_entries, [directory] * workers, chunks,
+                                  [num_journeys] * workers, [collect] * workers))
+    else:
+        parts = [_replay_entries(directory, entries, num_journeys, collect)]
+    elapsed = time.perf_counter() - start
+
+    totals = {key: sum(part[0][key] for part in parts) for key in parts[0][0]}
+    totals["seconds"] = round(elapsed, 3)
+    totals["journeys_per_sec"] = round(totals["journeys"] / elapsed, 1) if elapsed else 0.0
+    print(f"Replayed {totals['responses']} responses ({totals['journeys']} journeys, "
+          f"{totals['processed']} kept, {totals['errors']} errors) in {elapsed:.2f}s "
+          f"with {workers} worker(s): {totals['journeys_per_sec']} journeys/sec")
+
+    if collect:
+        results = sorted((r for part in parts for r in part[1]), key=lambda r: r["fetched_at"])
+        with open(output, 'wb') as f:
+            for result in results:
+                f.write(json_dumps(result) + b"\n")
+        print(f"✓ Wrote {len(results)} replayed results to {output}")
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch live TFL journeys and write them to " + OUTPUT_FILE)
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and refresh on an internal schedule instead of exiting after one cycle")
+    parser.add_argument("--interval", type=float, default=UPDATE_INTERVAL,
+                        help="Seconds between cycles in daemon mode (default: %(default)s, env UPDATE_INTERVAL)")
+    parser.add_argument("--jitter", type=float, default=UPDATE_JITTER,
+                        help="Maximum random jitter in seconds added to each wait (default: %(default)s, env UPDATE_JITTER)")
+    parser.add_argument("--routes", default=ROUTES_FILE or None, metavar="FILE",
+                        help="JSON or TOML file listing routes to refresh (env ROUTES_FILE); "
+                             "defaults to the built-in ORIGIN/DESTINATION route")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY,
+                        help="Maximum concurrent journey-planner requests when refreshing several routes "
+                             "(default: %(default)s, env FETCH_CONCURRENCY; 1 = sequential)")
+    parser.add_argument("--stream", action="store_true", default=TFL_STREAM,
+                        help="Decode journey responses while they download and stop reading once enough "
+                             "journeys are kept; not combined with --archive-dir (env TFL_STREAM)")
+    parser.add_argument("--output-mode", choices=["pretty", "compact"], default=OUTPUT_MODE,
+                        help="pretty: indented JSON; compact: minified JSON plus pre-compressed .gz "
+                             "(and .br with brotli installed) siblings (default: %(default)s, env OUTPUT_MODE)")
+    parser.add_argument("--manifest", default=OUTPUT_MANIFEST, metavar="FILE",
+                        help="Compact mode: record output sizes and SHA-256 hashes in FILE; empty disables "
+                             "(default: %(default)s, env OUTPUT_MANIFEST)")
+    parser.add_argument("--json-backend", choices=["auto", "json", "orjson"], default=JSON_BACKEND,
+                        help="JSON library for responses, archive and output files; auto uses orjson "
+                             "when installed (default: %(default)s, env JSON_BACKEND)")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL,
+                        help="Seconds a journey response is reused for identical queries; 0 disables "
+                             "(default: %(default)s, env CACHE_TTL)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR or None, metavar="DIR",
+                        help="Also keep cached responses on disk in DIR (env CACHE_DIR)")
+    parser.add_argument("--hedge", action="store_true", default=TFL_HEDGE,
+                        help="Send a duplicate of journey requests slower than the observed "
+                             f"p{TFL_HEDGE_PERCENTILE:g} latency and use the first answer (env TFL_HEDGE)")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR or None, metavar="DIR",
+                        help="Append raw TFL responses to a compressed, rotating archive in DIR (env ARCHIVE_DIR)")
+    parser.add_argument("--platform-cache", default=PLATFORM_CACHE_FILE or None, metavar="FILE",
+                        help="Keep learned platforms in FILE between runs, used to predict platforms "
+                             "TFL reports as TBC (env PLATFORM_CACHE_FILE)")
+    parser.add_argument("--metrics-file", default=None, metavar="FILE",
+                        help=f"Where to write per-stage timing metrics (default: {METRICS_FILE or 'disabled'}, "
+                             "env METRICS_FILE; empty string disables)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="In daemon mode, serve Prometheus metrics on this port at /metrics "
+                             "(default: %(default)s = disabled, env METRICS_PORT)")
+    parser.add_argument("--replay", metavar="ARCHIVE_DIR",
+                        help="Process archived raw responses from ARCHIVE_DIR offline and report throughput, then exit")
+    parser.add_argument("--replay-workers", type=int, default=1,
+                        help="Worker processes used by --replay (default: %(default)s)")
+    parser.add_argument("--replay-output", metavar="FILE",
+                        help="Write journeys produced by --replay to FILE as JSON lines")
+    parser.add_argument("--replay-journeys", type=int, default=NUM_JOURNEYS, metavar="N",
+                        help="Stop processing each replayed response after N valid journeys, "
+                             "as a live run does (default: %(default)s)")
+    parser.add_argument("--rate-limit", type=float, default=TFL_RATE_LIMIT, metavar="PER_MINUTE",
+                        help="TFL requests allowed per minute (default: %(default)s, env TFL_RATE_LIMIT)")
+    parser.add_argument("--rate-burst", type=int, default=TFL_RATE_BURST,
+                        help="Requests allowed back-to-back before throttling (default: %(default)s, env TFL_RATE_BURST)")
+    parser.add_argument("--rate-limit-db", default=TFL_RATE_LIMIT_DB or None, metavar="FILE",
+                        help="SQLite file used to share the rate limit between processes (env TFL_RATE_LIMIT_DB)")
+    args = parser.parse_args(argv)
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.jitter < 0 or args.jitter >= args.interval:
+        parser.error("--jitter must be non-negative and smaller than --interval")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.rate_limit <= 0 or args.rate_burst < 1:
+        parser.error("--rate-limit must be positive and --rate-burst at least 1")
+    if args.replay and not os.path.isdir(args.replay):
+        parser.error(f"--replay directory not found: {args.replay}")
+    if args.replay_workers < 1:
+        parser.error("--replay-workers must be at least 1")
+    if args.json_backend not in ("auto", *JSON_BACKENDS):
+        parser.error(f"--json-backend {args.json_backend} is not installed")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_json_backend(args.json_backend)
+    if args.replay:
+        replay_archive(args.replay, args.replay_workers, args.replay_journeys, output=args.replay_output)
+        return
+
+    routes = load_routes(args.routes) if args.routes else default_routes()
+    configure_rate_limiter(args.rate_limit, args.rate_burst, args.rate_limit_db)
+    configure_response_cache(ttl=args.cache_ttl, directory=args.cache_dir)
+    configure_hedging(args.hedge)
+    configure_archive(args.archive_dir)
+    if args.stream and args.archive_dir:
+        print("WARNING: --stream is ignored while --archive-dir is set; archiving needs whole responses")
+    configure_streaming(args.stream and not args.archive_dir)
+    configure_platform_cache(args.platform_cache)
+    configure_output(args.output_mode, args.manifest)
+    if args.metrics_file is not None:
+        configure_metrics_file(args.metrics_file)
+
+    if args.daemon:
+        if args.metrics_port:
+            start_metrics_server(args.metrics_port)
+        run_daemon(args.interval, args.jitter, routes, args.concurrency)
     else:
-        print("\n⚠ No journey data generated.")
+        if args.metrics_port:
+            print("WARNING: --metrics-port is only used in --daemon mode")
+        run_cycle(routes, args.concurrency)
 
 
 if __name__ == "__main__":